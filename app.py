@@ -1,60 +1,292 @@
-from flask import Flask, request, jsonify
-import pandas as pd
-import io
+from flask import Flask, request, jsonify, send_file, Response, g
+from werkzeug.exceptions import RequestEntityTooLarge
 import base64
-import datetime
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.enums import TA_CENTER
-
-from reportlab.lib.units import inch
-from reportlab.lib.utils import ImageReader
-from reportlab.platypus import Image
-from reportlab.platypus import KeepTogether
+import json
+import tempfile
+import uuid
+import zipfile
 import os
+import time
+
+from pipeline import process_file, selected_outputs, ARTIFACT_EXECUTORS
+from readers import detect_format, resolve_excel_engine, resolve_dtype_backend, SHEET_FORMATS, UploadError
+from excel_report import EXCEL_WRITE_MODE, EXCEL_WRITE_MODES, STABLE_ZIP_TIME
+from jobs import JobManager, QueueFullError, ARTIFACTS
+from cache import ResultCache, cache_key
+from batch import Batch, BatchError, batch_index
+from instrumentation import Timings, REGISTRY, record_request
+from compression import compress_response, etag_variants
+from datasets import valid_dataset_name
+from uploads import SpooledUploadRequest, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES
+from profiling import PROFILING_ENABLED, PROFILE_KINDS, RequestProfile, profile_kind, profile_path
+
+
+# ---------------- RESPONSES ----------------
+# "json" is the original base64-in-JSON payload. "zip" and "multipart"
+# stream the raw xlsx/PDF bytes next to a small summary JSON document.
+RESPONSE_FORMATS = ("json", "zip", "multipart")
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PDF_MIMETYPE = "application/pdf"
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def request_options():
+    return {
+        "excel_mode": request.values.get("excel_mode", EXCEL_WRITE_MODE),
+        "reader_engine": request.values.get("reader_engine"),
+        "dtype_backend": request.values.get("dtype_backend"),
+        "chunked": request.values.get("chunked") == "1",
+        "chunk_rows": request.values.get("chunk_rows", type=int),
+        "approx": request.values.get("approx") == "1",
+        "artifact_executor": request.values.get("artifact_executor"),
+        "sheets": request.values.get("sheets"),
+        "sheet_executor": request.values.get("sheet_executor"),
+        "outputs": request.values.get("outputs"),
+        "heatmap": request.values.get("heatmap") != "0",
+        "charts": request.values.get("charts") != "0",
+        "frequencies": request.values.get("frequencies") != "0",
+        "deterministic": request.values.get("deterministic") == "1",
+        "dataset": request.values.get("dataset"),
+        "dataset_key": request.values.get("dataset_key"),
+    }
+
+
+def invalid_option(options):
+    if options["excel_mode"] not in EXCEL_WRITE_MODES:
+        return f"Unknown excel_mode '{options['excel_mode']}'"
+    for name in ("artifact_executor", "sheet_executor"):
+        executor = options[name]
+        if executor is not None and executor not in ARTIFACT_EXECUTORS:
+            return f"Unknown {name} '{executor}'"
+    try:
+        # Also refuses an engine or backend whose package is not installed
+        if options["reader_engine"]:
+            resolve_excel_engine(options["reader_engine"])
+        if options["dtype_backend"]:
+            resolve_dtype_backend(options["dtype_backend"])
+    except ValueError as e:
+        return str(e)
+    if options["sheets"] and options["chunked"]:
+        return "sheets cannot be combined with chunked=1"
+    # Sketches only pay off on a stream; an in-memory frame is always exact
+    if options["approx"] and not options["chunked"]:
+        return "approx=1 needs chunked=1"
+    try:
+        selected_outputs(options["outputs"])
+    except ValueError as e:
+        return str(e)
+    if options["dataset_key"] and not options["dataset"]:
+        return "dataset_key needs a dataset"
+    if options["dataset"]:
+        if not valid_dataset_name(options["dataset"]):
+            return f"Invalid dataset name '{options['dataset']}'"
+        # A version depends on the one before it, and its state is exact
+        for name in ("chunked", "sheets", "approx", "deterministic"):
+            if options[name]:
+                return f"dataset cannot be combined with {name}"
+    return None
+
+
+def invalid_upload(options, uploaded_file):
+    # Options that only some kinds of upload support. A batch can mix
+    # formats, so there such a file just fails on its own.
+    if options["sheets"] and detect_format(uploaded_file.stream, uploaded_file.filename) not in SHEET_FORMATS:
+        return "Selecting sheets is only supported for Excel workbooks"
+    return None
+
+
+def cache_bypassed():
+    # ?cache=0 or "Cache-Control: no-cache" skips the result cache entirely
+    if request.values.get("cache") == "0":
+        return True
+    return "no-cache" in request.headers.get("Cache-Control", "")
+
+
+def requested_profile():
+    # ?profile=<kind> or an X-Profile header; None when not asked for
+    value = request.values.get("profile") or request.headers.get("X-Profile")
+    return profile_kind(value) if value else None
+
+
+def response_format():
+    # An explicit ?format= wins, otherwise negotiate on the Accept header
+    explicit = request.values.get("format")
+    if explicit:
+        return explicit
+
+    best = request.accept_mimetypes.best_match(
+        ["application/json", "application/zip", "multipart/mixed"],
+        default="application/json"
+    )
+    if best == "application/zip":
+        return "zip"
+    if best == "multipart/mixed":
+        return "multipart"
+    return "json"
+
+
+def summary_payload(result):
+    payload = {
+        "summary_text": result["summary_text"],
+        "excel_filename": result["excel_filename"],
+        "pdf_filename": result["pdf_filename"]
+    }
+    # Set when one artifact builder failed and only the other is returned
+    if result.get("errors"):
+        payload["errors"] = result["errors"]
+    if result.get("report_id"):
+        payload["report_id"] = result["report_id"]
+    # Row-level diff against the previous version of a dataset
+    if result.get("dataset"):
+        payload["dataset"] = result["dataset"]
+    return payload
+
+
+def upload_size(stream):
+    position = stream.tell()
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(position)
+    return size
+
+
+def artifact_parts(result):
+    # (filename, mimetype, buffer) for every artifact that was built
+    parts = []
+    if result["excel"] is not None:
+        parts.append((result["excel_filename"], XLSX_MIMETYPE, result["excel"].getbuffer()))
+    if result["pdf"] is not None:
+        parts.append((result["pdf_filename"], PDF_MIMETYPE, result["pdf"].getbuffer()))
+    return parts
+
+
+def encode_artifact(buffer):
+    if buffer is None:
+        return None
+    return base64.b64encode(buffer.getbuffer()).decode('utf-8')
+
+
+def json_response(result):
+    # getbuffer() avoids the extra .read() copy before base64 encoding
+    payload = summary_payload(result)
+    payload["excel_file"] = encode_artifact(result["excel"])
+    payload["pdf_file"] = encode_artifact(result["pdf"])
+    return jsonify(payload)
+
+
+def zip_member(result, filename):
+    # Deterministic reports get fixed member times, like their xlsx
+    if result.get("report_id"):
+        return zipfile.ZipInfo(filename, STABLE_ZIP_TIME)
+    return filename
+
+
+def zip_response(result):
+    # xlsx and PDF are already compressed, so store them as-is
+    archive = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+        for filename, _, data in artifact_parts(result):
+            zf.writestr(zip_member(result, filename), data)
+        zf.writestr(zip_member(result, "summary.json"), json.dumps(summary_payload(result)))
+    archive.seek(0)
+
+    download_name = os.path.splitext(result["excel_filename"])[0] + ".zip"
+    return send_file(archive, mimetype="application/zip",
+                     as_attachment=True, download_name=download_name)
+
+
+def part_header(boundary, filename, mimetype, length):
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Type: {mimetype}\r\n"
+        f"Content-Disposition: attachment; filename=\"{filename}\"\r\n"
+        f"Content-Length: {length}\r\n\r\n"
+    ).encode("utf-8")
+
+
+def multipart_part(boundary, filename, mimetype, data):
+    yield part_header(boundary, filename, mimetype, len(data))
+    for offset in range(0, len(data), STREAM_CHUNK_BYTES):
+        yield bytes(data[offset:offset + STREAM_CHUNK_BYTES])
+    yield b"\r\n"
+
+
+def multipart_file_part(boundary, filename, mimetype, path):
+    # Same as multipart_part, read from disk a chunk at a time
+    yield part_header(boundary, filename, mimetype, os.path.getsize(path))
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+    yield b"\r\n"
+
+
+def multipart_response(result):
+    boundary = result.get("report_id") or uuid.uuid4().hex
+    parts = [
+        ("summary.json", "application/json",
+         memoryview(json.dumps(summary_payload(result)).encode("utf-8"))),
+    ] + artifact_parts(result)
+
+    def generate():
+        for filename, mimetype, data in parts:
+            yield from multipart_part(boundary, filename, mimetype, data)
+        yield f"--{boundary}--\r\n".encode("utf-8")
+
+    return Response(generate(), mimetype=f"multipart/mixed; boundary={boundary}")
 
-from openpyxl.chart import BarChart, Reference
-from openpyxl.styles import PatternFill
 
+app = Flask(__name__)
+app.request_class = SpooledUploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES or None
+job_manager = JobManager(process_file)
+result_cache = ResultCache()
 
-def add_header_footer(canvas, doc):
-    canvas.saveState()
+# ---------------- INSTRUMENTATION ----------------
+# Every request gets a Timings object in g. Its stage durations go out as a
+# Server-Timing header and, with the request time and sizes, into the
+# Prometheus metrics served on GET /metrics. Streamed bodies (multipart,
+# batch) are timed up to the point where streaming starts.
+@app.before_request
+def start_timings():
+    g.timings = Timings()
+    g.request_start = time.perf_counter()
 
-    # -------- LOGO HEADER --------
-    logo_path = "logo.png"   # Put your logo file in same folder   
 
-    canvas.line(
-    doc.leftMargin,
-    0.75 * inch,
-    doc.width + doc.rightMargin,
-    0.75 * inch
-    )
-    
-    # -------- FOOTER --------   
-    canvas.setFont("Helvetica", 9)
-
-    # Left footer (developer credit)
-    canvas.drawString(
-        doc.leftMargin,
-        0.5 * inch,
-        "Developed by Tryfon Papadopoulos"
-    )
+@app.after_request
+def finish_timings(response):
+    if request.endpoint == "prometheus_metrics" or "timings" not in g:
+        return response
 
-    # Right footer (page number)
-    page_number_text = f"Page {doc.page}"
-    canvas.drawRightString(
-        doc.width + doc.rightMargin,
-        0.5 * inch,
-        page_number_text
-    )
+    elapsed = time.perf_counter() - g.request_start
+    server_timing = g.timings.server_timing()
+    total = f"total;dur={elapsed * 1000:.1f}"
+    response.headers["Server-Timing"] = f"{server_timing}, {total}" if server_timing else total
+    record_request(request.endpoint or "unknown", response.status_code, elapsed, g.timings)
+    return response
 
 
-    canvas.restoreState()
+# Registered after finish_timings so it runs first and is timed
+@app.after_request
+def compress(response):
+    if "timings" not in g:
+        return compress_response(response, request.accept_encodings)
+    with g.timings.stage("compress"):
+        return compress_response(response, request.accept_encodings)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    limit = request.max_content_length
+    return jsonify({"error": f"Upload is larger than the {limit} byte limit"}), 413
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
-app = Flask(__name__)
 
 @app.route("/")
 def home():
@@ -69,389 +301,225 @@ def process_excel():
     uploaded_file = request.files['file']
     original_filename = uploaded_file.filename
 
+    options = request_options()
+    error = invalid_option(options) or invalid_upload(options, uploaded_file)
+    if error:
+        return jsonify({"error": error}), 400
+
+    output_format = response_format()
+    if output_format not in RESPONSE_FORMATS:
+        return jsonify({"error": f"Unknown format '{output_format}'"}), 400
+
+    profile = None
+    profile_requested = requested_profile()
+    if profile_requested:
+        if not PROFILING_ENABLED:
+            return jsonify({"error": "Profiling is not enabled on this server"}), 403
+        if profile_requested not in PROFILE_KINDS:
+            return jsonify({"error": f"Unknown profile '{profile_requested}'"}), 400
+        profile = RequestProfile(profile_requested)
+        # The profilers only see this thread, so nothing goes to the pools
+        options = dict(options, artifact_executor="serial", sheet_executor="serial")
+
+    timings = g.timings
     try:
-        df = pd.read_excel(uploaded_file)
-        #original_columns = len(df.columns)
-
-        # Capture original columns
-        original_columns_list = list(df.columns)
-        original_columns_list = [col.strip().upper() for col in df.columns]
-        original_columns_count = len(original_columns_list)
-
-        # ---------------- CLEANING ----------------
-        df.dropna(how='all', inplace=True)
-        df.columns = [col.strip().upper() for col in df.columns]        
-        # ---------------- VALUE STANDARDIZATION ----------------
-
-        for col in df.columns:
-
-            if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
-
-                df[col] = (
-                    df[col]
-                    .where(df[col].notna(), None)   # Preserve real NaN values
-                    .astype(str)
-                    .str.strip()
-                    .str.replace(r'\s+', ' ', regex=True)
+        timings.count("bytes_in", upload_size(uploaded_file.stream))
+
+        # A profiled request always runs the pipeline, and so does a dataset
+        # version, which has to update the dataset's state
+        use_cache = (result_cache.enabled and not cache_bypassed()
+                     and profile is None and not options["dataset"])
+        key = None
+        if use_cache or options["deterministic"]:
+            with timings.stage("cache"):
+                key = cache_key(uploaded_file.stream, original_filename, options)
+
+        etag = None
+        if options["deterministic"]:
+            # The key covers the input, its file name, the options and the
+            # server's config and code version (see cache.py), and a
+            # deterministic body depends on nothing else but the format, so
+            # a client that holds any encoding of it is answered before any
+            # work is done
+            etag = f"{key}-{output_format}"
+            for tag in etag_variants(etag):
+                if request.if_none_match.contains(tag):
+                    response = Response(status=304)
+                    response.set_etag(tag)
+                    return response
+            options = dict(options, report_id=key)
+
+        if use_cache:
+            with timings.stage("cache"):
+                result = result_cache.get(key)
+            cache_status = "HIT" if result is not None else "MISS"
+        else:
+            result_cache.count("bypassed")
+            result = None
+            cache_status = "BYPASS"
+
+        if result is None:
+            if profile is not None:
+                result = profile.run(
+                    process_file, uploaded_file.stream, original_filename, options, timings=timings
                 )
-
-                # Convert empty strings back to proper NaN
-                df[col] = df[col].replace('', pd.NA)
-
-                # Standard formatting
-                df[col] = df[col].str.upper()
-
-                # Specific formatting rules
-                if col == "EMAIL":
-                    df[col] = df[col].str.lower()
-
-        # 🔥 Convert blank-only cells to real NaN
-        df.replace(r'^\s*$', pd.NA, regex=True, inplace=True)
-
-        # Clean duplicated column names like AGE.1
-        df.columns = df.columns.str.replace(r'\.\d+$', '', regex=True)
-
-        # Remove duplicate columns
-        df = df.loc[:, ~df.columns.duplicated()]
-
-        # Remove duplicate rows
-        duplicate_rows = df.duplicated().sum()
-        df = df.drop_duplicates()
-
-        processed_columns_list = list(df.columns)
-        processed_columns_count = len(processed_columns_list)
-
-        # Detect removed columns
-        removed_columns = list(set(original_columns_list) - set(processed_columns_list))
-
-        # ---------------- METRICS ----------------
-        num_rows = len(df)
-        num_columns = len(df.columns)
-        null_counts = df.isnull().sum()
-        total_cells = df.size
-        total_nulls = null_counts.sum()
-        quality_score = round((1 - total_nulls/total_cells) * 100, 2)
-
-        numeric_df = df.select_dtypes(include='number')
-        stats_df = pd.DataFrame()      
-
-        if not numeric_df.empty:
-            stats_df = pd.DataFrame({
-                "Mean": numeric_df.mean().round(2),
-                "Median": numeric_df.median().round(2),
-                "Std Dev": numeric_df.std().round(2),
-                "Min": numeric_df.min().round(2),
-                "Max": numeric_df.max().round(2)
-            })
-                         
-
-        country_freq = pd.DataFrame()
-        if "COUNTRY" in df.columns:
-            country_freq = df["COUNTRY"].value_counts().reset_index()
-            country_freq.columns = ["Country", "Count"]
-
-        nationality_freq = pd.DataFrame()
-        if "NATIONALITY" in df.columns:
-            nationality_freq = df["NATIONALITY"].value_counts().reset_index()
-            nationality_freq.columns = ["Nationality", "Count"]
-
-
-        summary_df = pd.DataFrame({
-            "Metric": [
-                "Rows",
-                "Columns",
-                "Duplicate Rows Removed",
-                "Total Null Values",
-                "Data Quality Score (%)"
-            ],
-            "Value": [
-                num_rows,
-                num_columns,
-                duplicate_rows,
-                total_nulls,
-                quality_score
-            ]
-        })
-
-        null_df = null_counts.reset_index()
-        null_df.columns = ["Column", "Null Count"]
-
-        # ---------------- EXCEL GENERATION ----------------
-        excel_filename = f"processed_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
-            df.to_excel(writer, sheet_name="DATA", index=False)
-            summary_df.to_excel(writer, sheet_name="SUMMARY", index=False)
-            stats_df.to_excel(writer, sheet_name="NUMERIC_STATS")
-            null_df.to_excel(writer, sheet_name="NULL_COUNTS", index=False)
-
-            if not country_freq.empty:
-                country_freq.to_excel(writer, sheet_name="COUNTRY_FREQ", index=False)
-
-            if not nationality_freq.empty:
-                nationality_freq.to_excel(writer, sheet_name="NATIONALITY_FREQ", index=False)                 
-
-            workbook = writer.book
-
-            # ---------------- MEAN BAR CHART ----------------
-            if not stats_df.empty:
-                sheet = writer.sheets["NUMERIC_STATS"]
-                chart = BarChart()
-                chart.title = "Mean Values"
-                chart.y_axis.title = "Mean"
-                chart.x_axis.title = "Columns"
-
-                data = Reference(sheet, min_col=2, min_row=1,
-                                    max_col=2, max_row=len(stats_df)+1)
-                cats = Reference(sheet, min_col=1, min_row=2,
-                                    max_row=len(stats_df)+1)
-
-                chart.add_data(data, titles_from_data=True)
-                chart.set_categories(cats)
-                sheet.add_chart(chart, "H2")
-
-            # ---------------- COUNTRY BAR CHART ----------------
-            if not country_freq.empty:
-                sheet = writer.sheets["COUNTRY_FREQ"]
-                chart = BarChart()
-                chart.title = "Country Distribution"
-                chart.y_axis.title = "Count"
-
-                data = Reference(sheet, min_col=2, min_row=1,
-                                    max_col=2, max_row=len(country_freq)+1)
-                cats = Reference(sheet, min_col=1, min_row=2,
-                                    max_row=len(country_freq)+1)
-
-                chart.add_data(data, titles_from_data=True)
-                chart.set_categories(cats)
-                sheet.add_chart(chart, "E2")
-
-            # ---------------- NATIONALITY BAR CHART ----------------
-            if not nationality_freq.empty:
-                sheet = writer.sheets["NATIONALITY_FREQ"]
-                chart = BarChart()
-                chart.title = "Nationality Distribution"
-                chart.y_axis.title = "Count"
-
-                data = Reference(sheet, min_col=2, min_row=1,
-                                    max_col=2, max_row=len(country_freq)+1)
-                cats = Reference(sheet, min_col=1, min_row=2,
-                                    max_row=len(country_freq)+1)
-
-                chart.add_data(data, titles_from_data=True)
-                chart.set_categories(cats)
-                sheet.add_chart(chart, "E2")
-
-
-            # ---------------- DATA QUALITY VISUAL ----------------
-            summary_sheet = writer.sheets["SUMMARY"]
-            if quality_score >= 80:
-                fill = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
-            elif quality_score >= 50:
-                fill = PatternFill(start_color="FFD700", end_color="FFD700", fill_type="solid")
             else:
-                fill = PatternFill(start_color="FF7F7F", end_color="FF7F7F", fill_type="solid")
-
-            summary_sheet["B4"].fill = fill  # Quality score cell
+                result = process_file(uploaded_file.stream, original_filename, options, timings=timings)
+            if use_cache and not result["errors"]:
+                result_cache.put(key, result)
+
+        timings.count("bytes_out", sum(len(data) for _, _, data in artifact_parts(result)))
+        with timings.stage("encode"):
+            if output_format == "zip":
+                response = zip_response(result)
+            elif output_format == "multipart":
+                response = multipart_response(result)
+            else:
+                response = json_response(result)
 
-            # ---------------- NULL HEATMAP ----------------
-            heatmap_sheet = workbook.create_sheet("NULL_HEATMAP")
+        response.headers["X-Cache"] = cache_status
+        if etag is not None and not result["errors"]:
+            # A partial result may not come out the same next time
+            response.set_etag(etag)
+        if profile is not None:
+            response.headers["X-Profile-Id"] = profile.id
+        return response
 
-            for r in range(len(df)):
-                for c in range(len(df.columns)):
-                    cell = heatmap_sheet.cell(row=r+1, column=c+1)
-                    if pd.isnull(df.iloc[r, c]):
-                        cell.fill = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
+    except Exception as e:
+        payload = {"error": str(e)}
+        if profile is not None:
+            payload["profile_id"] = profile.id
+        # A file that cannot be read is the client's to fix
+        return jsonify(payload), 400 if isinstance(e, UploadError) else 500
+
+
+@app.route("/profiles/<profile_id>", methods=["GET"])
+def download_profile(profile_id):
+    path = profile_path(profile_id) if PROFILING_ENABLED else None
+    if path is None:
+        return jsonify({"error": "Unknown profile"}), 404
+    mimetype = "text/plain" if path.endswith(".collapsed") else "application/octet-stream"
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=os.path.basename(path))
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+# ---------------- BATCH ENDPOINT ----------------
+# Upload any number of files as "files" (or "file"), zip archives included.
+# The response is a multipart/mixed stream: for each file, in the order
+# they finish, a NNNN_summary.json part followed by its xlsx and PDF, and
+# at the end an index.json part covering the whole batch in upload order.
+@app.route("/process-batch", methods=["POST"])
+def process_batch():
+
+    if MAX_BATCH_UPLOAD_BYTES:
+        # Must be set before the body is parsed
+        request.max_content_length = MAX_BATCH_UPLOAD_BYTES
+    uploaded_files = request.files.getlist("files") + request.files.getlist("file")
+    if not uploaded_files:
+        return jsonify({"error": "No file uploaded"}), 400
 
-        
-        excel_buffer.seek(0)
-        excel_base64 = base64.b64encode(excel_buffer.read()).decode('utf-8')
+    options = request_options()
+    error = invalid_option(options)
+    if error:
+        return jsonify({"error": error}), 400
+    if options["dataset"]:
+        return jsonify({"error": "Dataset versions are uploaded one at a time to /process-excel"}), 400
 
+    try:
+        batch = Batch(process_file, uploaded_files, options)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    boundary = uuid.uuid4().hex
+
+    def generate():
+        entries = []
+        with batch:
+            for entry in batch:
+                entries.append(entry)
+                summary = {key: value for key, value in entry.items() if not key.endswith("_path")}
+                yield from multipart_part(
+                    boundary, f"{entry['index']:04d}_summary.json", "application/json",
+                    memoryview(json.dumps(summary).encode("utf-8"))
+                )
+                if "excel_path" in entry:
+                    yield from multipart_file_part(
+                        boundary, entry["excel_filename"], XLSX_MIMETYPE, entry["excel_path"]
+                    )
+                if "pdf_path" in entry:
+                    yield from multipart_file_part(
+                        boundary, entry["pdf_filename"], PDF_MIMETYPE, entry["pdf_path"]
+                    )
+
+        yield from multipart_part(
+            boundary, "index.json", "application/json",
+            memoryview(json.dumps(batch_index(entries)).encode("utf-8"))
+        )
+        yield f"--{boundary}--\r\n".encode("utf-8")
 
-        # ---------------- AI STYLE SUMMARY TEXT ----------------             
-        summary_text = f"""
-        The uploaded file '{original_filename}' originally contained {original_columns_count} columns.
+    return Response(generate(), mimetype=f"multipart/mixed; boundary={boundary}")
 
-        Original Columns:
-        {", ".join(original_columns_list)}
 
-        After cleaning and standardization, the processed dataset ('{excel_filename}') contains {num_rows} rows and {processed_columns_count} columns.
+# ---------------- ASYNC JOB ENDPOINTS ----------------
+@app.route("/jobs", methods=["POST"])
+def create_job():
 
-        Processed Columns:
-        {", ".join(processed_columns_list)}
-        """
+    if 'file' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
 
-        if removed_columns:
-            summary_text += f"\nColumns Removed: {', '.join(removed_columns)}"
-        else:
-            summary_text += "\nColumns Removed: None"
-
-        summary_text += f"""
-
-        Data Quality Score: {quality_score}%.
-        Duplicate Rows Removed: {duplicate_rows}.
-        Total Null Values: {total_nulls}.
-        """
-
-        # ---------------- PDF GENERATION ----------------
-        pdf_filename = f"report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"        
-        
-        pdf_buffer = io.BytesIO()
-        #doc = SimpleDocTemplate(pdf_buffer)
-        doc = SimpleDocTemplate(
-            pdf_buffer,
-            topMargin=0.6 * inch   # default is usually 1 inch
-        )
-        elements = []
-        styles = getSampleStyleSheet()    
-
-        # -------- LOGO (TOP CENTERED) --------
-        logo_path = "logo.png"               
-
-        if os.path.exists(logo_path):
-            logo = Image(logo_path)
-
-            # Smaller controlled size (clean, not dominant)            
-            logo.drawWidth = 3 * inch
-            logo.drawHeight = logo.drawWidth * 83 / 516
-            
-            logo.hAlign = 'CENTER'           
-
-            elements.append(logo)
-            elements.append(Spacer(1, 0.08 * inch))
-
-
-        # -------- LINE --------    
-        elements.append(Spacer(1, 0.1 * inch))
-        # Thin line
-        # line = Table([[""]], colWidths=[450], rowHeights=[1])
-        line = Table([[""]], colWidths=[doc.width], rowHeights=[1])
-        line.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.black)
-        ]))
-        elements.append(line)
-
-        elements.append(Spacer(1, 0.2 * inch))
-
-        # -------- TITLE --------                           
-        elements.append(Paragraph("Excel Data Analysis Report", styles['Title']))
-        elements.append(Spacer(1, 0.3 * inch))
-
-        elements.append(Paragraph(f"Original File: {original_filename}", styles['Normal']))
-        elements.append(Paragraph(f"Processed Excel File: {excel_filename}", styles['Normal']))
-        elements.append(Paragraph(f"Generated PDF File: {pdf_filename}", styles['Normal']))
-        elements.append(Paragraph(f"Generated On: {datetime.datetime.now()}", styles['Normal']))
-        elements.append(Spacer(1, 0.4 * inch))
-
-
-        custom_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            spaceAfter=6,  # points (6pt = subtle spacing)
-        )       
-
-        for line in summary_text.split("\n"):
-            if line.strip():
-                elements.append(Paragraph(line.strip(), custom_style))
-
-        #elements.append(Paragraph("<b>Original Columns:</b>", styles['Normal']))
-        #for col in original_columns_list:
-        #    elements.append(Paragraph(f"- {col}", styles['Normal']))               
-
-        table_data = summary_df.values.tolist()
-        table_data.insert(0, list(summary_df.columns))       
-
-        table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.grey),
-            ('GRID', (0,0), (-1,-1), 1, colors.black)
-        ]))
-
-        centered_heading = ParagraphStyle(
-        name='CenteredHeading',
-        parent=styles['Heading2'],
-        alignment=TA_CENTER)
-
-        elements.append(Spacer(1, 0.2 * inch))        
-        elements.append(Paragraph("Summary Metrics", centered_heading))
-        elements.append(Spacer(1, 0.15 * inch))     
-        
-        elements.append(KeepTogether(table))
-
-        # A) NULL COUNTS TABLE
-        elements.append(Spacer(1, 0.3 * inch))
-        elements.append(Paragraph("Null Values per Column", centered_heading))
-        elements.append(Spacer(1, 0.15 * inch))
-
-        null_table_data = null_df.values.tolist()
-        null_table_data.insert(0, list(null_df.columns))
-
-        null_table = Table(null_table_data)
-        null_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.grey),
-            ('GRID', (0,0), (-1,-1), 1, colors.black)
-        ]))
-
-        elements.append(KeepTogether(null_table))
-
-        # B) NUMERIC STATISTICS TABLE
-        if not stats_df.empty:
-            elements.append(Spacer(1, 0.3 * inch))
-            elements.append(Paragraph("Numeric Statistics", centered_heading))
-            elements.append(Spacer(1, 0.15 * inch))
-
-            stats_table_data = stats_df.reset_index().values.tolist()
-            stats_table_data.insert(0, ["Column"] + list(stats_df.columns))           
-            
-            available_width = doc.width
-            num_cols = len(stats_table_data[0])
-            col_width = available_width / num_cols
-
-            stats_table = Table(
-                stats_table_data,
-                colWidths=[col_width] * num_cols,
-                repeatRows=1
-            )
-
-            stats_table.setStyle(TableStyle([
-                ('BACKGROUND', (0,0), (-1,0), colors.grey),
-                ('GRID', (0,0), (-1,-1), 1, colors.black),
-                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                ('ALIGN', (1,1), (-1,-1), 'CENTER'),
-            ]))        
-
-            elements.append(KeepTogether(stats_table))
-
-        # C) COUNTRY FREQUENCY TABLE
-        if not country_freq.empty:
-            elements.append(Spacer(1, 0.3 * inch))
-            elements.append(Paragraph("Country Frequency", centered_heading))
-            elements.append(Spacer(1, 0.15 * inch))
-
-            country_table_data = country_freq.values.tolist()
-            country_table_data.insert(0, list(country_freq.columns))
-
-            country_table = Table(country_table_data)
-            country_table.setStyle(TableStyle([
-                ('BACKGROUND', (0,0), (-1,0), colors.grey),
-                ('GRID', (0,0), (-1,-1), 1, colors.black)
-            ]))
-
-            elements.append(KeepTogether(country_table))            
-
-        doc.build(elements, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
-
-        pdf_buffer.seek(0)
-        pdf_base64 = base64.b64encode(pdf_buffer.read()).decode('utf-8')
-
-        return jsonify({
-            "excel_file": excel_base64,
-            "pdf_file": pdf_base64,
-            "summary_text": summary_text,
-            "excel_filename": excel_filename,
-            "pdf_filename": pdf_filename
-        })
+    options = request_options()
+    error = invalid_option(options) or invalid_upload(options, request.files['file'])
+    if error:
+        return jsonify({"error": error}), 400
 
+    try:
+        job_id = job_manager.submit(request.files['file'], options)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"job_id": job_id, "status": "queued"}), 202, {"Location": f"/jobs/{job_id}"}
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
+
+
+@app.route("/jobs/<job_id>/<artifact>", methods=["GET"])
+def job_artifact(job_id, artifact):
+    if artifact not in ARTIFACTS:
+        return jsonify({"error": f"Unknown artifact '{artifact}'"}), 404
+
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if status["status"] != "done":
+        return jsonify({"error": f"Job is {status['status']}", "status": status}), 409
+
+    path = job_manager.artifact_path(job_id, artifact)
+    if artifact == "summary":
+        return send_file(path, mimetype="application/json")
+
+    with open(job_manager.artifact_path(job_id, "summary")) as f:
+        summary = json.load(f)
+    if artifact in summary.get("errors", {}):
+        return jsonify({"error": f"{artifact} could not be built: {summary['errors'][artifact]}"}), 404
+    if not os.path.exists(path):
+        return jsonify({"error": f"{artifact} was not requested for this job"}), 404
+
+    if artifact == "excel":
+        return send_file(path, mimetype=XLSX_MIMETYPE, as_attachment=True,
+                         download_name=summary["excel_filename"])
+    return send_file(path, mimetype=PDF_MIMETYPE, as_attachment=True,
+                     download_name=summary["pdf_filename"])
@@ -0,0 +1,219 @@
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import as_completed
+
+from pools import ProcessPool, node_share, in_pool_options
+
+
+# ---------------- BATCH PROCESSING ----------------
+# A batch is a set of uploaded files, or zip archives of them, that run
+# through the normal pipeline in a process pool, one file per worker. Every
+# input is saved to a temporary batch directory first. Workers write their
+# artifacts next to it and only hand back the small summary, so no
+# workbook bytes are pickled between processes. Results are yielded in
+# completion order, so the caller can stream each file as soon as it is done.
+# BATCH_WORKERS is for the whole node (see pools.py).
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", os.cpu_count() or 1))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 100))
+
+# The upload limit only covers the compressed archive, so zip members are
+# capped as they are extracted, whatever sizes their headers claim: one
+# member may expand to BATCH_MAX_MEMBER_BYTES and all members of a batch
+# together to BATCH_MAX_EXTRACTED_BYTES (0 turns a limit off).
+BATCH_MAX_MEMBER_BYTES = int(os.environ.get("BATCH_MAX_MEMBER_BYTES", 100 * 1024 * 1024))
+BATCH_MAX_EXTRACTED_BYTES = int(os.environ.get("BATCH_MAX_EXTRACTED_BYTES", 1024 * 1024 * 1024))
+COPY_BLOCK_BYTES = 1024 * 1024
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+class BatchError(Exception):
+    pass
+
+
+def batch_pool():
+    # Rebuilt if one of its workers dies (see pools.py)
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPool(node_share(BATCH_WORKERS))
+        return _batch_pool
+
+
+def is_archive(filename):
+    # .xlsx files are zip archives too, so only trust the extension
+    return os.path.splitext(filename or "")[1].lower() == ".zip"
+
+
+def archive_members(archive):
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or name.startswith(".") or "__MACOSX" in info.filename:
+            continue
+        yield info, name
+
+
+def member_limit(extracted):
+    # Bytes the next member may expand to, and the error past that; None
+    # when neither limit is on
+    limits = []
+    if BATCH_MAX_MEMBER_BYTES:
+        limits.append((BATCH_MAX_MEMBER_BYTES, f"larger than the {BATCH_MAX_MEMBER_BYTES} byte limit"))
+    if BATCH_MAX_EXTRACTED_BYTES:
+        limits.append((BATCH_MAX_EXTRACTED_BYTES - extracted,
+                       f"past the {BATCH_MAX_EXTRACTED_BYTES} byte limit of a batch"))
+    return min(limits, default=None)
+
+
+def copy_limited(src, dst, limit):
+    # Copies src to dst and returns the byte count, or None as soon as more
+    # than limit bytes come out
+    copied = 0
+    while True:
+        block = src.read(COPY_BLOCK_BYTES)
+        if not block:
+            return copied
+        copied += len(block)
+        if copied > limit:
+            return None
+        dst.write(block)
+
+
+def save_inputs(uploaded_files, batch_dir):
+    # Returns [(filename, path)] in upload order, archives expanded in place.
+    # Members are saved under a numbered name, never under their own path.
+    inputs = []
+    extracted = 0
+
+    def add(filename, save):
+        if len(inputs) >= BATCH_MAX_FILES:
+            raise BatchError(f"A batch can hold at most {BATCH_MAX_FILES} files")
+        path = os.path.join(batch_dir, f"{len(inputs):04d}_input{os.path.splitext(filename)[1]}")
+        save(path)
+        inputs.append((filename, path))
+
+    for uploaded_file in uploaded_files:
+        if not is_archive(uploaded_file.filename):
+            add(uploaded_file.filename, uploaded_file.save)
+            continue
+
+        try:
+            archive = zipfile.ZipFile(uploaded_file.stream)
+        except zipfile.BadZipFile:
+            raise BatchError(f"'{uploaded_file.filename}' is not a valid zip archive")
+
+        with archive:
+            for info, name in archive_members(archive):
+                def extract(path, info=info, name=name):
+                    nonlocal extracted
+                    limit = member_limit(extracted)
+                    with archive.open(info) as src, open(path, "wb") as dst:
+                        if limit is None:
+                            shutil.copyfileobj(src, dst)
+                            return
+                        # The header is checked first, the bytes anyway
+                        size = None
+                        if info.file_size <= limit[0]:
+                            size = copy_limited(src, dst, limit[0])
+                        if size is None:
+                            raise BatchError(f"'{name}' in '{uploaded_file.filename}' expands {limit[1]}")
+                        extracted += size
+                add(name, extract)
+
+    if not inputs:
+        raise BatchError("No files to process")
+    return inputs
+
+
+def run_batch_file(process_fn, index, filename, path, options):
+    # Runs inside a pool process
+    entry = {"index": index, "filename": filename}
+    try:
+        with open(path, "rb") as stream:
+            result = process_fn(stream, filename, options)
+    except Exception as e:
+        entry.update(status="failed", error=str(e))
+        return entry
+
+    stem = f"{index:04d}"
+    for name in ("excel", "pdf"):
+        if result[name] is None:
+            continue
+        artifact_path = f"{path}.{name}"
+        with open(artifact_path, "wb") as f:
+            f.write(result[name].getbuffer())
+        entry[f"{name}_path"] = artifact_path
+
+    entry.update(
+        status="done",
+        summary_text=result["summary_text"],
+        excel_filename=f"{stem}_{result['excel_filename']}",
+        pdf_filename=f"{stem}_{result['pdf_filename']}",
+        errors=result["errors"]
+    )
+    return entry
+
+
+class Batch:
+    # Owns the temporary batch directory; iterate it to run the files and
+    # close it (or use it as a context manager) to remove everything
+
+    def __init__(self, process_fn, uploaded_files, options):
+        self.process_fn = process_fn
+        # The batch pool already spreads files over the cores
+        self.options = in_pool_options(options)
+        self.dir = tempfile.mkdtemp(prefix="excel-api-batch-")
+        try:
+            self.inputs = save_inputs(uploaded_files, self.dir)
+        except Exception:
+            self.close()
+            raise
+
+    def __iter__(self):
+        futures = {
+            batch_pool().submit(run_batch_file, self.process_fn, index, filename, path, self.options):
+                (index, filename)
+            for index, (filename, path) in enumerate(self.inputs)
+        }
+        try:
+            for future in as_completed(futures):
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    index, filename = futures[future]
+                    entry = {"index": index, "filename": filename, "status": "failed", "error": str(e)}
+                yield entry
+        finally:
+            # Client went away: drop the files that have not started yet
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def batch_index(entries):
+    # Combined index of a finished batch, in upload order, without file paths
+    files = [
+        {key: value for key, value in entry.items() if not key.endswith("_path")}
+        for entry in sorted(entries, key=lambda entry: entry["index"])
+    ]
+    succeeded = sum(1 for entry in files if entry["status"] == "done")
+    return {
+        "total": len(files),
+        "succeeded": succeeded,
+        "failed": len(files) - succeeded,
+        "files": files
+    }
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import platform
+import statistics
+import tempfile
+import tracemalloc
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate import write_workbook
+
+
+# ---------------- PIPELINE BENCHMARKS ----------------
+# Posts synthetic workbooks to /process-excel through the Flask test client
+# and records:
+# - the end-to-end time
+# - every pipeline stage, read from the Server-Timing header
+# - the peak traced memory of one extra run under tracemalloc
+# The older app_0_good_working / app_1_good_working versions can be
+# measured too (end-to-end and memory only, they report no stages).
+#
+#   python benchmarks/bench.py                      run and compare
+#   python benchmarks/bench.py --save-baseline      store the baseline
+#   python benchmarks/bench.py --apps app,app_1_good_working --scenarios small
+#   python benchmarks/bench.py --require-baseline   in CI
+#
+# Results are compared with benchmarks/baseline.json when it exists. Any
+# time or peak memory more than --tolerance above the baseline (and above
+# the noise floor) is a regression, and the exit status is 1. Without a
+# baseline the run only reports, unless --require-baseline is given: then
+# a missing baseline exits with status 2, so a CI job cannot pass without
+# comparing anything. Baselines are machine specific, so save one on the
+# box that runs the comparison: .github/workflows/ci.yml measures a pull
+# request's base commit first, on the same runner, and then the change.
+
+SCENARIOS = {
+    "small": {"rows": 1000},
+    "medium": {"rows": 20000},
+    "wide": {"rows": 1000, "numeric_columns": 50, "text_columns": 50},
+    "high_cardinality": {"rows": 10000, "cardinality": 5000},
+    "dirty": {"rows": 10000, "null_rate": 0.3, "duplicate_rate": 0.2},
+}
+
+DEFAULT_SCENARIOS = ("small", "medium", "wide", "high_cardinality", "dirty")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "excel-api-bench")
+
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.05
+MIN_MEMORY_DELTA_MB = 5.0
+
+
+def workbook_for(name):
+    # Generated once per spec and kept between runs
+    spec = SCENARIOS[name]
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(CACHE_DIR, f"{name}_{digest}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_workbook(path + ".tmp.xlsx", **spec)
+        os.replace(path + ".tmp.xlsx", path)
+    return path
+
+
+def parse_server_timing(value):
+    stages = {}
+    for entry in (value or "").split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration) / 1000
+    return stages
+
+
+def post_workbook(client, path):
+    with open(path, "rb") as f:
+        # cache=0 so repeated runs are not answered from the result cache
+        response = client.post(
+            "/process-excel?cache=0",
+            data={"file": (f, os.path.basename(path))}
+        )
+    response.get_data()
+    if response.status_code != 200:
+        raise RuntimeError(f"/process-excel returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def run_app(module_name, path, repeat):
+    client = importlib.import_module(module_name).app.test_client()
+
+    # Warm-up run, so imports and first-use setup are not measured
+    post_workbook(client, path)
+
+    durations = []
+    stage_runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = post_workbook(client, path)
+        durations.append(time.perf_counter() - start)
+        stage_runs.append(parse_server_timing(response.headers.get("Server-Timing")))
+
+    tracemalloc.start()
+    try:
+        post_workbook(client, path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    stage_names = {name for run in stage_runs for name in run if name != "total"}
+    return {
+        "seconds": statistics.median(durations),
+        "min_seconds": min(durations),
+        "peak_mb": peak / (1024 * 1024),
+        "stages": {
+            name: statistics.median(run.get(name, 0.0) for run in stage_runs)
+            for name in sorted(stage_names)
+        },
+    }
+
+
+def run_benchmarks(scenarios, apps, repeat):
+    results = {}
+    for name in scenarios:
+        path = workbook_for(name)
+        results[name] = {"spec": SCENARIOS[name], "apps": {}}
+        for module_name in apps:
+            result = run_app(module_name, path, repeat)
+            results[name]["apps"][module_name] = result
+            print(f"{name:<18} {module_name:<22} {result['seconds']:8.3f}s  "
+                  f"peak {result['peak_mb']:8.1f} MB")
+            for stage, seconds in result["stages"].items():
+                print(f"{'':<18} {'  ' + stage:<22} {seconds:8.3f}s")
+    return results
+
+
+def regressed(new, old, tolerance, min_delta):
+    return new > old * (1 + tolerance) and new - old > min_delta
+
+
+def compare(results, baseline, tolerance):
+    # Returns a list of human readable regression messages
+    problems = []
+    for scenario, scenario_result in results.items():
+        base_scenario = baseline.get("scenarios", {}).get(scenario)
+        if base_scenario is None or base_scenario["spec"] != scenario_result["spec"]:
+            continue
+
+        for app, result in scenario_result["apps"].items():
+            base = base_scenario["apps"].get(app)
+            if base is None:
+                continue
+
+            checks = [("end-to-end", result["seconds"], base["seconds"], MIN_SECONDS_DELTA, "s")]
+            checks += [
+                (f"stage {stage}", seconds, base["stages"][stage], MIN_SECONDS_DELTA, "s")
+                for stage, seconds in result["stages"].items() if stage in base["stages"]
+            ]
+            checks.append(("peak memory", result["peak_mb"], base["peak_mb"], MIN_MEMORY_DELTA_MB, " MB"))
+
+            for label, new, old, min_delta, unit in checks:
+                if regressed(new, old, tolerance, min_delta):
+                    problems.append(
+                        f"{scenario} / {app} / {label}: {new:.3f}{unit} vs baseline "
+                        f"{old:.3f}{unit} (+{(new / old - 1) * 100:.0f}%)"
+                    )
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the /process-excel pipeline")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--apps", default="app",
+                        help="comma separated app modules, e.g. app,app_0_good_working,app_1_good_working")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown or memory growth over the baseline (0.25 = 25%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="fail (exit status 2) when there is no baseline to compare with")
+    parser.add_argument("--output", help="also write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    apps = [name.strip() for name in args.apps.split(",") if name.strip()]
+
+    # The apps read logo.png and friends relative to the working directory
+    os.chdir(ROOT)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scenarios": run_benchmarks(scenarios, apps, args.repeat),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        if args.require_baseline:
+            print(f"\nNO BASELINE at {args.baseline}, run with --save-baseline first")
+            return 2
+        print("No baseline to compare with, run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    problems = compare(report["scenarios"], baseline, args.tolerance)
+    if problems:
+        print("\nREGRESSIONS:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+
+    print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
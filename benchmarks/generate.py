@@ -0,0 +1,103 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+# ---------------- SYNTHETIC WORKBOOKS ----------------
+# Deterministic workbooks for the benchmarks. The same spec and seed always
+# give the same file. The frame looks like a typical upload:
+# - NAME, COUNTRY, NATIONALITY and EMAIL columns
+# - extra numeric and text columns
+# - messy case and whitespace in the text values
+# - nulls and duplicate rows at configurable rates
+
+DEFAULT_SPEC = {
+    "rows": 10000,
+    "numeric_columns": 4,
+    "text_columns": 2,
+    "null_rate": 0.05,
+    "duplicate_rate": 0.02,
+    "cardinality": 50,
+    "country": True,
+    "nationality": True,
+    "email": True,
+    "seed": 0,
+}
+
+
+def messy_values(rng, prefix, cardinality, size):
+    # Values drawn from `cardinality` distinct names, each written with
+    # random case and padding so standardization has work to do
+    base = np.array([f"{prefix} {i}" for i in range(cardinality)], dtype=object)
+    values = base[rng.integers(0, cardinality, size)]
+    style = rng.integers(0, 4, size)
+    values = np.where(style == 1, np.char.upper(values.astype(str)), values)
+    values = np.where(style == 2, np.char.lower(values.astype(str)), values)
+    values = np.where(style == 3, np.char.add("  ", values.astype(str)), values)
+    return values.astype(object)
+
+
+def generate_frame(**spec):
+    spec = {**DEFAULT_SPEC, **spec}
+    rng = np.random.default_rng(spec["seed"])
+    rows = spec["rows"]
+    cardinality = spec["cardinality"]
+
+    # Unique rows first, the duplicates are copies of some of them
+    unique_rows = max(rows - int(rows * spec["duplicate_rate"]), 1)
+
+    columns = {"Name": messy_values(rng, "person", max(cardinality, 10), unique_rows)}
+    if spec["country"]:
+        columns["Country"] = messy_values(rng, "country", cardinality, unique_rows)
+    if spec["nationality"]:
+        columns["Nationality"] = messy_values(rng, "nationality", cardinality, unique_rows)
+    if spec["email"]:
+        users = rng.integers(0, max(cardinality, 10) * 100, unique_rows)
+        columns["Email"] = [f"User{user}@Example.COM " for user in users]
+
+    for i in range(spec["numeric_columns"]):
+        if i % 2:
+            columns[f"Count {i}"] = rng.integers(0, 1000, unique_rows).astype(float)
+        else:
+            columns[f"Value {i}"] = rng.normal(100, 15, unique_rows).round(3)
+
+    for i in range(spec["text_columns"]):
+        columns[f"Text {i}"] = messy_values(rng, f"label{i}", cardinality, unique_rows)
+
+    df = pd.DataFrame(columns)
+
+    # Nulls, never a whole row so dropna(how="all") keeps the row count
+    null_mask = rng.random(df.shape) < spec["null_rate"]
+    null_mask[:, 0] = False
+    df = df.mask(null_mask)
+
+    duplicates = df.iloc[rng.integers(0, unique_rows, rows - unique_rows)]
+    df = pd.concat([df, duplicates], ignore_index=True)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+def write_workbook(path, **spec):
+    generate_frame(**spec).to_excel(path, index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic benchmark workbook")
+    parser.add_argument("path")
+    for name, default in DEFAULT_SPEC.items():
+        if isinstance(default, bool):
+            parser.add_argument(f"--no-{name}", dest=name, action="store_false")
+        else:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=type(default), default=default)
+
+    args = parser.parse_args(argv)
+    spec = {name: getattr(args, name) for name in DEFAULT_SPEC}
+    write_workbook(args.path, **spec)
+    print(f"Wrote {args.path} ({os.path.getsize(args.path)} bytes)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
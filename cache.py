@@ -0,0 +1,261 @@
+import io
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from rules import COLUMN_RULES
+from readers import EXCEL_ENGINE, DTYPE_BACKEND
+from pdf_report import PDF_TOP_N, PDF_LONG_TABLE_ROWS
+from pools import node_share
+
+
+# ---------------- RESULT CACHE ----------------
+# Results are keyed on a hash of the uploaded bytes, the upload's file name
+# and the processing options, so re-uploading the same workbook returns the
+# stored artifacts without re-running the pipeline. The file name is part
+# of the key because it picks the reader and is quoted in the summary text
+# and the PDF. There is an in-memory LRU tier and an optional on-disk tier
+# (enabled by setting CACHE_DIR). Every HTTP worker process has its own
+# memory tier, so CACHE_MEMORY_BYTES is for the whole node and each worker
+# gets node_share() of it (see pools.py); the disk tier is shared.
+#
+# The key also covers the server side of a result, so a deploy with other
+# column rules, PDF limits, reader defaults or code never serves entries
+# (on disk, or as ETags in clients) built by the one before it. The code
+# version is APP_VERSION when the deploy sets it (a git sha, say), and
+# otherwise a hash of the modules next to this one.
+
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") == "1"
+CACHE_MEMORY_BYTES = int(os.environ.get("CACHE_MEMORY_BYTES", 256 * 1024 * 1024))
+CACHE_DIR = os.environ.get("CACHE_DIR")
+CACHE_DISK_BYTES = int(os.environ.get("CACHE_DISK_BYTES", 2 * 1024 * 1024 * 1024))
+APP_VERSION = os.environ.get("APP_VERSION")
+
+SUMMARY_KEYS = ("summary_text", "excel_filename", "pdf_filename")
+# Only deterministic results have a report id, and older disk entries lack it
+OPTIONAL_KEYS = ("report_id",)
+# Artifact -> file name in a disk tier entry. A result built with a
+# narrower outputs= option leaves the other artifacts as None.
+ARTIFACT_FILES = {"excel": "excel.xlsx", "pdf": "report.pdf"}
+
+
+def code_version():
+    if APP_VERSION:
+        return APP_VERSION
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(root)):
+        if name.endswith(".py"):
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(name.encode("utf-8") + b"\0" + f.read())
+    return digest.hexdigest()
+
+
+SERVER_CONFIG = {
+    "rules": COLUMN_RULES.fingerprint,
+    "pdf_top_n": PDF_TOP_N,
+    "pdf_long_table_rows": PDF_LONG_TABLE_ROWS,
+    "excel_engine": EXCEL_ENGINE,
+    "dtype_backend": DTYPE_BACKEND,
+    "version": code_version(),
+}
+
+
+def cache_key(stream, filename, options):
+    position = stream.tell()
+    digest = hashlib.file_digest(stream, "sha256")
+    stream.seek(position)
+
+    digest.update(json.dumps([filename, options, SERVER_CONFIG], sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def entry_from_result(result):
+    entry = {key: result[key] for key in SUMMARY_KEYS}
+    entry.update((key, result.get(key)) for key in OPTIONAL_KEYS)
+    for name in ARTIFACT_FILES:
+        entry[name] = bytes(result[name].getbuffer()) if result[name] is not None else None
+    return entry
+
+
+def result_from_entry(entry):
+    # Only complete results are cached, so there are never builder errors
+    result = {key: entry[key] for key in SUMMARY_KEYS}
+    result.update((key, entry.get(key)) for key in OPTIONAL_KEYS)
+    result["errors"] = {}
+    for name in ARTIFACT_FILES:
+        result[name] = io.BytesIO(entry[name]) if entry[name] is not None else None
+    return result
+
+
+def entry_size(entry):
+    artifacts = sum(len(entry[name]) for name in ARTIFACT_FILES if entry[name] is not None)
+    return artifacts + len(entry["summary_text"])
+
+
+class MemoryTier:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        size = entry_size(entry)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self.size -= entry_size(self._entries.pop(key))
+        self._entries[key] = entry
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= entry_size(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+class DiskTier:
+    # One directory per key holding excel.xlsx, report.pdf and summary.json.
+    # Directory mtimes are bumped on every hit and the oldest are evicted
+    # first once the tier grows past max_bytes.
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, "summary.json")) as f:
+                entry = json.load(f)
+            stored = entry.pop("artifacts", list(ARTIFACT_FILES))
+            for name, filename in ARTIFACT_FILES.items():
+                entry[name] = None
+                if name in stored:
+                    with open(os.path.join(path, filename), "rb") as f:
+                        entry[name] = f.read()
+            # Evicted by another worker since the read is also a miss
+            os.utime(path)
+        except OSError:
+            return None
+        return entry
+
+    def put(self, key, entry):
+        if os.path.exists(self._path(key)):
+            return
+
+        # Build the entry next to its final location, then rename it in
+        tmp_path = self._path(f"{key}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_path)
+        stored = [name for name in ARTIFACT_FILES if entry[name] is not None]
+        with open(os.path.join(tmp_path, "summary.json"), "w") as f:
+            summary = {k: entry.get(k) for k in SUMMARY_KEYS + OPTIONAL_KEYS}
+            json.dump({**summary, "artifacts": stored}, f)
+        for name in stored:
+            with open(os.path.join(tmp_path, ARTIFACT_FILES[name]), "wb") as f:
+                f.write(entry[name])
+
+        try:
+            os.rename(tmp_path, self._path(key))
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            path = self._path(name)
+            if name.endswith(".tmp") or not os.path.isdir(path):
+                continue
+            size = sum(e.stat().st_size for e in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+            total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            shutil.rmtree(self._path(name), ignore_errors=True)
+
+
+class ResultCache:
+
+    def __init__(self, memory_bytes=node_share(CACHE_MEMORY_BYTES), disk_dir=CACHE_DIR,
+                 disk_bytes=CACHE_DISK_BYTES, enabled=CACHE_ENABLED):
+        self.enabled = enabled
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = DiskTier(disk_dir, disk_bytes) if disk_dir else None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self.memory.get(key)
+        if entry is not None:
+            self.count("memory_hits")
+            return result_from_entry(entry)
+
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.count("disk_hits")
+                with self._lock:
+                    self.memory.put(key, entry)
+                return result_from_entry(entry)
+
+        self.count("misses")
+        return None
+
+    def put(self, key, result):
+        entry = entry_from_result(result)
+        with self._lock:
+            self.memory.put(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self.memory)
+            stats["memory_bytes"] = self.memory.size
+        stats["enabled"] = self.enabled
+        stats["disk_enabled"] = self.disk is not None
+        return stats
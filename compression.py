@@ -0,0 +1,65 @@
+import os
+import gzip
+import importlib.util
+
+
+# ---------------- RESPONSE COMPRESSION ----------------
+# Buffered responses of at least COMPRESS_MIN_BYTES with a compressible
+# type are sent gzip or zstd encoded, whichever the client's
+# Accept-Encoding prefers (zstd wins a tie; it needs the optional
+# zstandard package). The base64 artifacts in the JSON payload shrink by
+# roughly a quarter and the summary text far more. xlsx, PDF and zip
+# bodies are compressed already and streamed responses are left alone.
+# A strong ETag gets the encoding appended, since the encoded bytes are a
+# different representation. COMPRESS_MIN_BYTES=0 turns compression off.
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 1))
+ZSTD_LEVEL = int(os.environ.get("ZSTD_LEVEL", 3))
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/plain", "text/html")
+
+HAS_ZSTD = importlib.util.find_spec("zstandard") is not None
+ENCODINGS = ("zstd", "gzip") if HAS_ZSTD else ("gzip",)
+
+
+def compress(data, encoding):
+    if encoding == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def etag_variants(etag):
+    # Every tag a client may hold for one entity: identity plus each encoding
+    return [etag] + [f"{etag}-{encoding}" for encoding in ENCODINGS]
+
+
+def response_encoding(response, accept_encodings):
+    if not COMPRESS_MIN_BYTES or response.direct_passthrough or response.is_streamed:
+        return None
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return None
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or "Content-Encoding" in response.headers:
+        return None
+    if (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return None
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress_response(response, accept_encodings):
+    # Vary goes on every response that could have been compressed, so
+    # caches keep the encodings apart
+    if COMPRESS_MIN_BYTES and response.mimetype in COMPRESSIBLE_MIMETYPES:
+        response.vary.add("Accept-Encoding")
+
+    encoding = response_encoding(response, accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
@@ -0,0 +1,214 @@
+import os
+import re
+import fcntl
+import pickle
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from dedup import row_fingerprints
+
+
+# ---------------- DATASET VERSIONS ----------------
+# ?dataset=<name> treats an upload as the next version of a named dataset.
+# The state of the last version is kept under DATASET_DIR, one pickle per
+# dataset, and holds no rows:
+# - per raw row, its 64-bit fingerprint, the fingerprint of the row after
+#   cleaning (and whether cleaning dropped it as empty), and a hash of its
+#   key value when the client names a key column with dataset_key=<column>
+# - the exact StreamingStats over the deduplicated rows (row and null
+#   counts, per-value counts behind the numeric statistics, frequencies)
+# - per distinct cleaned row, what the statistics need to take it back
+#   out (StreamingStats.removable_rows: numeric and frequency values as
+#   codes, one byte for every other column)
+# A new version is matched against it by raw fingerprint: only rows that
+# are new get cleaned, and only cleaned rows that left or joined the
+# deduplicated set go through the statistics, so that work follows the
+# number of changed rows. Reading the upload, fingerprinting it and the
+# duplicate check still cover every row, as vectorized passes over 64-bit
+# integers. The xlsx lists every cleaned row, so asking for it cleans the
+# whole upload as a full run does; outputs=summary (or summary,pdf) is the
+# cheap refresh.
+#
+# The state is rebuilt from the upload when the header, the key column,
+# the column rules or the kind of a raw column (numeric, text, ...)
+# changed, since any of those changes how every row is read or cleaned.
+#
+# Without a key a changed row counts as one removed and one added row.
+# With a key, an added and a removed row sharing a key value are counted
+# as one changed row instead.
+#
+# Versions of one dataset are processed one at a time: the state is
+# locked (flock) from load to save, across workers and processes.
+
+DATASET_DIR = os.environ.get("DATASET_DIR", os.path.join(tempfile.gettempdir(), "excel-api-datasets"))
+
+DATASET_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,99}")
+
+
+def valid_dataset_name(name):
+    return DATASET_NAME.fullmatch(name) is not None
+
+
+class DatasetStore:
+
+    def __init__(self, root=DATASET_DIR):
+        self.root = root
+
+    def _path(self, name, extension):
+        if not valid_dataset_name(name):
+            raise ValueError(f"Invalid dataset name '{name}'")
+        return os.path.join(self.root, name + extension)
+
+    @contextmanager
+    def locked(self, name):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(name, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self, name):
+        try:
+            with open(self._path(name, ".pkl"), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, name, state):
+        # Written next to the old state, then renamed over it
+        path = self._path(name, ".pkl")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+DATASETS = DatasetStore()
+
+
+def key_column(columns, key):
+    # The raw column the client named, matched like the cleaned headers
+    if not key:
+        return None
+    for col in columns:
+        if str(col).strip().upper() == key.strip().upper():
+            return col
+    raise ValueError(f"Key column '{key}' is not in the upload")
+
+
+def column_kind(values):
+    if pd.api.types.is_bool_dtype(values):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(values):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return "datetime"
+    return "text"
+
+
+def key_hashes(values):
+    # Hashed like the rows, missing keys left out (<NA>)
+    hashes = pd.Series(row_fingerprints(values.to_frame()), dtype="UInt64")
+    return hashes.mask(values.isna().to_numpy()).array
+
+
+def in_sorted(sorted_values, values):
+    # np.isin for a sorted haystack. Sorted values are looked up fastest:
+    # binary searches that walk the array front to back stay in cache.
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_values, values)
+    return sorted_values[np.minimum(positions, len(sorted_values) - 1)] == values
+
+
+def sort_fingerprints(fingerprints):
+    # The fingerprints sorted, and the row each came from. Kept like this
+    # in the state, so the next version's lookups need no sort of the old
+    # ones. Rows with equal fingerprints are equal, so any of them will do.
+    order = np.argsort(fingerprints).astype(np.int32)
+    return fingerprints[order], order
+
+
+def match_rows(previous, fingerprints):
+    # Position in the previous version of every row, -1 for new rows; both
+    # as returned by sort_fingerprints()
+    (old_sorted, old_order), (new_sorted, new_order) = previous, fingerprints
+    matched = np.full(len(new_sorted), -1)
+    if len(old_sorted):
+        positions = np.minimum(np.searchsorted(old_sorted, new_sorted), len(old_sorted) - 1)
+        matched[new_order] = np.where(old_sorted[positions] == new_sorted, old_order[positions], -1)
+    return matched
+
+
+def merge_removable(hashes, rows, new_hashes, new_rows):
+    # StreamingStats.removable_rows() frames keyed by cleaned row
+    # fingerprint, hashes sorted. The new fingerprints are not among the
+    # old ones. Returns both merged in fingerprint order; the new values
+    # are coded into each column's categories, so the old codes are only
+    # copied, and categories no row uses any more are dropped.
+    order = np.argsort(new_hashes)
+    new_hashes, new_rows = new_hashes[order], new_rows.iloc[order].reset_index(drop=True)
+    if rows is None:
+        return new_hashes, new_rows
+
+    at = np.searchsorted(hashes, new_hashes)
+    merged = {}
+    for col in rows.columns:
+        old, new = rows[col].array, new_rows[col].array
+        recode = old.categories.get_indexer(new.categories)
+        missing = recode < 0
+        recode[missing] = len(old.categories) + np.arange(missing.sum())
+        categories = pd.Index(old.categories.append(new.categories[missing]), dtype=old.categories.dtype)
+        # code -1 (missing) picks the trailing -1
+        codes = np.insert(old.codes.astype(np.intp), at, np.append(recode, -1)[new.codes])
+
+        used = np.bincount(codes[codes >= 0], minlength=len(categories)) > 0
+        if not used.all():
+            codes = np.append(np.cumsum(used) - 1, -1)[codes]
+            categories = categories[used]
+        # The codes are right by construction; the old dtype is reused when
+        # the categories did not change, which skips checking them again
+        dtype = old.dtype if categories.equals(old.categories) else pd.CategoricalDtype(categories)
+        merged[col] = pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+    return np.insert(hashes, at, new_hashes), pd.DataFrame(merged, columns=rows.columns)
+
+
+def distinct_counts(sorted_values):
+    starts = np.flatnonzero(np.r_[len(sorted_values) > 0, sorted_values[1:] != sorted_values[:-1]])
+    return sorted_values[starts], np.diff(np.r_[starts, len(sorted_values)])
+
+
+def counts_at(values, counts, sorted_keys):
+    # counts[values == key] for every key, 0 when it is not there
+    if len(values) == 0:
+        return np.zeros(len(sorted_keys), dtype=counts.dtype)
+    positions = np.minimum(np.searchsorted(values, sorted_keys), len(values) - 1)
+    return np.where(values[positions] == sorted_keys, counts[positions], 0)
+
+
+def row_diff(previous, fingerprints, previous_keys=None, keys=None):
+    # Row counts between two versions, as multisets of raw rows; previous
+    # and fingerprints as returned by sort_fingerprints()
+    (old_sorted, old_order), (new_sorted, new_order) = previous, fingerprints
+    old_values, old_counts = distinct_counts(old_sorted)
+    new_values, new_counts = distinct_counts(new_sorted)
+    added = int(np.maximum(new_counts - counts_at(old_values, old_counts, new_values), 0).sum())
+    removed = int(np.maximum(old_counts - counts_at(new_values, new_counts, old_values), 0).sum())
+
+    changed = 0
+    if previous_keys is not None and keys is not None:
+        added_keys = pd.Series(keys[new_order[~in_sorted(old_values, new_sorted)]]).dropna()
+        removed_keys = pd.Series(previous_keys[old_order[~in_sorted(new_values, old_sorted)]]).dropna()
+        changed = min(len(set(added_keys) & set(removed_keys)), added, removed)
+
+    return {
+        "rows_added": added - changed,
+        "rows_removed": removed - changed,
+        "rows_changed": changed,
+        "rows_unchanged": len(new_sorted) - added,
+    }
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+
+# ---------------- DUPLICATE DETECTION ----------------
+# Every row is reduced to one 64-bit fingerprint with a vectorized hash
+# over all columns. The fingerprints drive both the duplicate count and
+# the removal, so rows are hashed once instead of twice. Like
+# df.duplicated(), missing values compare equal. Two different rows only
+# collide if their 64-bit fingerprints match, which we accept.
+#
+# Integer columns are hashed as floats. Chunks (and dataset versions) get
+# their dtypes inferred on their own, and an integer column with a blank in
+# one chunk is read as floats there; its rows must still match the same
+# rows from a chunk without blanks.
+#
+# String columns are hashed as categoricals: each distinct string is hashed
+# once and the hashes are taken by code. Factorizing a string column is
+# several times cheaper than hashing every value, and a categorical hashes
+# to the same fingerprints as its values.
+
+
+def row_fingerprints(df):
+    casts = {}
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype):
+            casts[col] = "float64"
+        elif pd.api.types.is_string_dtype(dtype) and dtype != object:
+            casts[col] = "category"
+    if casts:
+        df = df.astype(casts)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def find_duplicates(df):
+    # Boolean mask of rows that repeat an earlier row (keep="first")
+    return pd.Series(row_fingerprints(df)).duplicated().to_numpy()
+
+
+def drop_duplicate_rows(df):
+    # Returns the deduplicated frame and the index labels of the removed rows
+    mask = find_duplicates(df)
+    return df[~mask], df.index[mask]
+
+
+def merge_runs(older, newer):
+    # Both sorted and disjoint (newer only holds unseen fingerprints)
+    return np.sort(np.concatenate([older, newer]), kind="stable")
+
+
+class DuplicateTracker:
+    # Chunked variant: remembers the fingerprints of every row seen so far,
+    # so a row is dropped when it repeats a row from this or any earlier
+    # chunk. Only sorted uint64 arrays are kept between chunks.
+    #
+    # The fingerprints are kept as sorted runs, each at least twice as long
+    # as the next one. A chunk's new fingerprints become a run of their own
+    # and are merged into the smaller runs before them, like binary carries,
+    # so a fingerprint is copied O(log n) times in all and a lookup searches
+    # O(log n) runs. (Merging every chunk into one array copied all the
+    # fingerprints seen so far on every chunk, quadratic over a file.)
+
+    def __init__(self):
+        self.runs = []
+        self.duplicate_index = []
+        self.duplicates = 0
+
+    def seen(self, hashes):
+        # Looked up in sorted order, which walks each run front to back
+        # instead of jumping around it
+        order = np.argsort(hashes)
+        ordered = hashes[order]
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.searchsorted(run, ordered)
+            positions[positions == len(run)] = 0
+            found |= run[positions] == ordered
+        mask = np.empty_like(found)
+        mask[order] = found
+        return mask
+
+    def add(self, new_hashes):
+        run = new_hashes
+        while self.runs and len(self.runs[-1]) < 2 * len(run):
+            run = merge_runs(self.runs.pop(), run)
+        self.runs.append(run)
+
+    def filter(self, chunk):
+        hashes = row_fingerprints(chunk)
+
+        mask = pd.Series(hashes).duplicated().to_numpy() | self.seen(hashes)
+
+        # Unique already: repeats within the chunk are masked too
+        new_hashes = np.sort(hashes[~mask])
+        if len(new_hashes):
+            self.add(new_hashes)
+
+        self.duplicates += int(mask.sum())
+        self.duplicate_index.extend(chunk.index[mask])
+        return chunk[~mask]
@@ -0,0 +1,389 @@
+import io
+import os
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import PatternFill, Font
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.utils import get_column_letter
+
+from instrumentation import stage
+
+
+# ---------------- NULL HEATMAP HELPERS ----------------
+NULL_FILL = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
+
+
+def null_heatmap_ranges(df, row_offset=0):
+    # One vectorized isna() mask, then find the vertical runs of nulls in
+    # every column. Each run becomes one "A3:A9" style range, so the work
+    # grows with the number of null runs instead of rows x cols.
+    # row_offset shifts the ranges when df is one chunk of a larger frame.
+    mask = df.isna().to_numpy().T
+    if mask.size == 0:
+        return []
+
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+
+    start_cols, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    letters = [get_column_letter(c + 1) for c in range(mask.shape[0])]
+    return [
+        f"{letters[c]}{row_offset + s + 1}:{letters[c]}{row_offset + e}"
+        for c, s, e in zip(start_cols.tolist(), starts.tolist(), ends.tolist())
+    ]
+
+
+def add_null_heatmap(workbook, df=None, ranges=None, title="NULL_HEATMAP"):
+    heatmap_sheet = workbook.create_sheet(title)
+
+    if ranges is None:
+        ranges = null_heatmap_ranges(df)
+    if ranges:
+        # A single always-true rule with one shared fill over every null run
+        heatmap_sheet.conditional_formatting.add(
+            " ".join(ranges),
+            FormulaRule(formula=["TRUE"], fill=NULL_FILL)
+        )
+
+    return heatmap_sheet
+
+
+# ---------------- EXCEL HELPERS ----------------
+# "standard" builds the whole workbook through pd.ExcelWriter.
+# "streaming" uses an openpyxl write-only workbook, so DATA rows are
+# flushed to disk as they are appended instead of being kept as cells.
+EXCEL_WRITE_MODE = os.environ.get("EXCEL_WRITE_MODE", "standard")
+EXCEL_WRITE_MODES = ("standard", "streaming")
+EXCEL_CHUNK_ROWS = 10000
+
+REPORT_SHEETS = ("DATA", "SUMMARY", "NUMERIC_STATS", "NULL_COUNTS")
+
+# Frequency tables come as a list of (column, table, chart) and each gets
+# a "<COLUMN>_FREQ" sheet, with a bar chart when chart is true.
+# heatmap=False and charts=False leave those optional sections out.
+
+
+def quality_fill(quality_score):
+    if quality_score >= 80:
+        color = "90EE90"
+    elif quality_score >= 50:
+        color = "FFD700"
+    else:
+        color = "FF7F7F"
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+def quality_score_row(summary_df):
+    # Row of the quality score in the SUMMARY sheet (header is row 1)
+    metrics = list(summary_df["Metric"])
+    return metrics.index("Data Quality Score (%)") + 2
+
+
+def add_bar_chart(sheet, title, num_rows, anchor, y_title, x_title=None):
+    chart = BarChart()
+    chart.title = title
+    chart.y_axis.title = y_title
+    if x_title:
+        chart.x_axis.title = x_title
+
+    data = Reference(sheet, min_col=2, min_row=1,
+                        max_col=2, max_row=num_rows+1)
+    cats = Reference(sheet, min_col=1, min_row=2,
+                        max_row=num_rows+1)
+
+    chart.add_data(data, titles_from_data=True)
+    chart.set_categories(cats)
+    sheet.add_chart(chart, anchor)
+
+
+def add_report_charts(sheets, stats_df, frequency_charts):
+    # ---------------- MEAN BAR CHART ----------------
+    if not stats_df.empty:
+        add_bar_chart(sheets["NUMERIC_STATS"], "Mean Values", len(stats_df),
+                      "H2", "Mean", "Columns")
+
+    # ---------------- FREQUENCY BAR CHARTS ----------------
+    # (sheet, table) pairs; the table header holds the label
+    for sheet, freq in frequency_charts:
+        add_bar_chart(sheet, f"{freq.columns[0]} Distribution",
+                      len(freq), "E2", "Count")
+
+
+def frequency_sheet_names(prefix, columns):
+    # "<prefix><COLUMN>_FREQ", the column name cut to fit Excel's 31
+    # characters and kept unique regardless of case
+    room = 31 - len(prefix) - len("_FREQ")
+    names = []
+    for column in columns:
+        short = str(column).translate(INVALID_TITLE_CHARS)[:room]
+        candidate = short
+        n = 1
+        while f"{prefix}{candidate}_FREQ".lower() in (name.lower() for name in names):
+            n += 1
+            candidate = f"{short[:room - len(str(n)) - 1]}~{n}"
+        names.append(f"{prefix}{candidate}_FREQ")
+    return names
+
+
+def excel_rows(df, chunk_rows=EXCEL_CHUNK_ROWS):
+    # Yield plain Python rows, converting one chunk at a time so only a
+    # small object-dtype slice of the frame exists at once
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+
+def write_header(sheet, header, header_font=None):
+    header_cells = []
+    for value in header:
+        cell = WriteOnlyCell(sheet, value=value)
+        if header_font is not None and value is not None:
+            cell.font = header_font
+        header_cells.append(cell)
+    sheet.append(header_cells)
+
+
+def write_frame(sheet, df, index=False, header_font=None):
+    header = list(df.columns)
+    if index:
+        header = [None] + header
+    write_header(sheet, header, header_font)
+
+    if index:
+        for label, row in zip(df.index, excel_rows(df)):
+            sheet.append((label,) + row)
+    else:
+        for row in excel_rows(df):
+            sheet.append(row)
+
+
+def write_standard_sheets(writer, df, summary_df, stats_df, null_df,
+                          frequencies, quality_score, prefix="", timings=None,
+                          heatmap=True, charts=True):
+    df.to_excel(writer, sheet_name=f"{prefix}DATA", index=False)
+    summary_df.to_excel(writer, sheet_name=f"{prefix}SUMMARY", index=False)
+    stats_df.to_excel(writer, sheet_name=f"{prefix}NUMERIC_STATS")
+    null_df.to_excel(writer, sheet_name=f"{prefix}NULL_COUNTS", index=False)
+
+    frequency_charts = []
+    names = frequency_sheet_names(prefix, [column for column, _, _ in frequencies])
+    for name, (_, freq, chart) in zip(names, frequencies):
+        freq.to_excel(writer, sheet_name=name, index=False)
+        if chart:
+            frequency_charts.append((writer.sheets[name], freq))
+
+    workbook = writer.book
+    # The report sheets of this section, by their unprefixed names
+    sheets = {name: writer.sheets[f"{prefix}{name}"] for name in REPORT_SHEETS}
+
+    if charts:
+        add_report_charts(sheets, stats_df, frequency_charts)
+
+    # ---------------- DATA QUALITY VISUAL ----------------
+    summary_sheet = sheets["SUMMARY"]
+    summary_sheet.cell(row=quality_score_row(summary_df), column=2).fill = quality_fill(quality_score)
+
+    # ---------------- NULL HEATMAP ----------------
+    if heatmap:
+        with stage(timings, "heatmap"):
+            add_null_heatmap(workbook, df, title=f"{prefix}NULL_HEATMAP")
+
+
+def build_excel_standard(df, summary_df, stats_df, null_df,
+                         frequencies, quality_score, timings=None,
+                         heatmap=True, charts=True):
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
+        write_standard_sheets(writer, df, summary_df, stats_df, null_df,
+                              frequencies, quality_score, timings=timings,
+                              heatmap=heatmap, charts=charts)
+
+    return excel_buffer
+
+
+class StreamingWorkbook:
+    # Write-only workbook whose DATA sheet is fed chunk by chunk. The
+    # report sheets are only written in finish(), once the statistics over
+    # every chunk are known. Null runs for the heatmap are collected as
+    # the chunks go by.
+
+    def __init__(self, workbook=None, prefix="", timings=None, heatmap=True, charts=True):
+        # Several sections can share one workbook, each with its own prefix
+        self.workbook = workbook or Workbook(write_only=True)
+        self.prefix = prefix
+        self.timings = timings
+        self.heatmap = heatmap
+        self.charts = charts
+        self.header_font = Font(bold=True)
+        self.sheets = {}
+        self.create_sheet("DATA")
+        self.rows_written = 0
+        self.heatmap_ranges = []
+        self._header_written = False
+
+    def create_sheet(self, name):
+        self.sheets[name] = self.workbook.create_sheet(f"{self.prefix}{name}")
+        return self.sheets[name]
+
+    def append_data(self, df):
+        data_sheet = self.sheets["DATA"]
+        if not self._header_written:
+            write_header(data_sheet, list(df.columns), self.header_font)
+            self._header_written = True
+
+        for row in excel_rows(df):
+            data_sheet.append(row)
+
+        if self.heatmap:
+            with stage(self.timings, "heatmap"):
+                self.heatmap_ranges.extend(null_heatmap_ranges(df, row_offset=self.rows_written))
+        self.rows_written += len(df)
+
+    def write_report(self, summary_df, stats_df, null_df, frequencies, quality_score):
+        header_font = self.header_font
+        sheets = self.sheets
+
+        # ---------------- SUMMARY + DATA QUALITY VISUAL ----------------
+        summary_sheet = self.create_sheet("SUMMARY")
+        summary_sheet.append([WriteOnlyCell(summary_sheet, value=col) for col in summary_df.columns])
+        fill_row = quality_score_row(summary_df)
+        for row_idx, (metric, value) in enumerate(excel_rows(summary_df), start=2):
+            value_cell = WriteOnlyCell(summary_sheet, value=value)
+            if row_idx == fill_row:
+                value_cell.fill = quality_fill(quality_score)
+            summary_sheet.append([metric, value_cell])
+
+        self.create_sheet("NUMERIC_STATS")
+        if not stats_df.empty:
+            write_frame(sheets["NUMERIC_STATS"], stats_df, index=True, header_font=header_font)
+
+        self.create_sheet("NULL_COUNTS")
+        write_frame(sheets["NULL_COUNTS"], null_df, header_font=header_font)
+
+        frequency_charts = []
+        names = frequency_sheet_names(self.prefix, [column for column, _, _ in frequencies])
+        for name, (_, freq, chart) in zip(names, frequencies):
+            freq_sheet = self.workbook.create_sheet(name)
+            write_frame(freq_sheet, freq, header_font=header_font)
+            if chart:
+                frequency_charts.append((freq_sheet, freq))
+
+        if self.charts:
+            add_report_charts(sheets, stats_df, frequency_charts)
+
+        # ---------------- NULL HEATMAP ----------------
+        if self.heatmap:
+            with stage(self.timings, "heatmap"):
+                add_null_heatmap(self.workbook, ranges=self.heatmap_ranges,
+                                 title=f"{self.prefix}NULL_HEATMAP")
+
+    def finish(self, summary_df, stats_df, null_df, frequencies, quality_score):
+        self.write_report(summary_df, stats_df, null_df, frequencies, quality_score)
+
+        excel_buffer = io.BytesIO()
+        self.workbook.save(excel_buffer)
+        return excel_buffer
+
+
+def build_excel_streaming(df, summary_df, stats_df, null_df,
+                          frequencies, quality_score, timings=None,
+                          heatmap=True, charts=True):
+    streaming = StreamingWorkbook(timings=timings, heatmap=heatmap, charts=charts)
+    streaming.append_data(df)
+    return streaming.finish(summary_df, stats_df, null_df, frequencies, quality_score)
+
+
+def build_excel(df, summary_df, stats_df, null_df,
+                frequencies, quality_score, mode="standard", timings=None,
+                heatmap=True, charts=True):
+    if mode not in EXCEL_WRITE_MODES:
+        raise ValueError(f"Unknown excel_mode '{mode}', expected one of {', '.join(EXCEL_WRITE_MODES)}")
+
+    builder = build_excel_streaming if mode == "streaming" else build_excel_standard
+    return builder(df, summary_df, stats_df, null_df,
+                   frequencies, quality_score, timings=timings,
+                   heatmap=heatmap, charts=charts)
+
+
+# ---------------- MULTI-SHEET WORKBOOKS ----------------
+# When several input sheets are processed, every one gets its own section
+# of report sheets in a single workbook, named "<sheet>_DATA",
+# "<sheet>_SUMMARY" and so on. Excel caps sheet titles at 31 characters,
+# so the input sheet name is shortened to leave room for the report sheet
+# names (frequency sheet names are cut to fit what is left).
+SECTION_NAME_CHARS = 31 - len("_NATIONALITY_FREQ")
+INVALID_TITLE_CHARS = str.maketrans({c: "_" for c in "[]:*?/\\"})
+
+
+def section_prefixes(sheet_names):
+    prefixes = []
+    for name in sheet_names:
+        short = str(name).translate(INVALID_TITLE_CHARS).strip("' ")[:SECTION_NAME_CHARS] or "SHEET"
+        candidate = short
+        n = 1
+        # Sheet titles are unique regardless of case
+        while f"{candidate}_".lower() in (prefix.lower() for prefix in prefixes):
+            n += 1
+            candidate = f"{short[:SECTION_NAME_CHARS - len(str(n)) - 1]}~{n}"
+        prefixes.append(f"{candidate}_")
+    return prefixes
+
+
+def build_excel_sections(sections, mode="standard", timings=None, heatmap=True, charts=True):
+    # sections is a list of (prefix, df, excel tables) in output order
+    if mode not in EXCEL_WRITE_MODES:
+        raise ValueError(f"Unknown excel_mode '{mode}', expected one of {', '.join(EXCEL_WRITE_MODES)}")
+
+    if mode == "streaming":
+        workbook = Workbook(write_only=True)
+        for prefix, df, tables in sections:
+            streaming = StreamingWorkbook(workbook, prefix, timings, heatmap, charts)
+            streaming.append_data(df)
+            streaming.write_report(*tables)
+
+        excel_buffer = io.BytesIO()
+        workbook.save(excel_buffer)
+        return excel_buffer
+
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
+        for prefix, df, tables in sections:
+            write_standard_sheets(writer, df, *tables, prefix=prefix, timings=timings,
+                                  heatmap=heatmap, charts=charts)
+
+    return excel_buffer
+
+
+# ---------------- DETERMINISTIC OUTPUT ----------------
+# openpyxl stamps the save time into docProps/core.xml and into every zip
+# entry, so saving the same workbook twice gives different bytes.
+# stable_xlsx() rewrites the archive with both times fixed. The members are
+# re-deflated, which costs a fraction of building the workbook.
+STABLE_ZIP_TIME = (1980, 1, 1, 0, 0, 0)
+STABLE_CORE_TIME = b"1980-01-01T00:00:00Z"
+CORE_TIMES = re.compile(rb"(<dcterms:(created|modified)\b[^>]*>)[^<]*(</dcterms:\2>)")
+
+
+def stable_xlsx(excel_buffer):
+    stable = io.BytesIO()
+    excel_buffer.seek(0)
+    with zipfile.ZipFile(excel_buffer) as source, \
+            zipfile.ZipFile(stable, "w", zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == "docProps/core.xml":
+                data = CORE_TIMES.sub(rb"\g<1>" + STABLE_CORE_TIME + rb"\g<3>", data)
+            target.writestr(zipfile.ZipInfo(info.filename, STABLE_ZIP_TIME), data,
+                            compress_type=zipfile.ZIP_DEFLATED)
+    return stable
@@ -0,0 +1,48 @@
+import gc
+import os
+
+
+# ---------------- GUNICORN ----------------
+# Production server settings, picked up by "gunicorn app:app" from the
+# working directory (the Procfile names the file explicitly too).
+#
+# The app is imported once in the master (preload_app) and warmed up there
+# before any worker forks: pandas, openpyxl, reportlab, the PDF template
+# and the readers are loaded a single time and the workers share those
+# pages copy-on-write. gc.freeze() moves everything loaded so far out of
+# the collector's reach, so collections in a worker do not touch (and
+# copy) the shared pages. A worker that restarts or is OOM-killed comes
+# back as a fork of the warm master, without importing anything.
+#
+# Workers are threaded (gthread), so a worker busy with one report still
+# takes in uploads and streams downloads for others. WEB_CONCURRENCY sets
+# the worker count (CPU count by default) and GUNICORN_THREADS the threads
+# per worker. Set WARM_UP=0 to skip the warm-up.
+#
+# The job, batch and artifact pools and the result cache's memory tier are
+# sized for the node, not per worker (see pools.py). The pools start their
+# processes from a fork server rather than forking a threaded worker.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+# Read back by pools.py, which splits the node's pool sizes over the workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+
+# gthread workers heartbeat from their main loop, so this only catches a
+# worker that is stuck, not a long request
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 60))
+
+WARM_UP = os.environ.get("WARM_UP", "1") == "1"
+
+
+def on_starting(server):
+    # preload_app has already imported the app at this point
+    if WARM_UP:
+        from pipeline import warm_up
+        warm_up()
+        server.log.info("Warmed up the report pipeline")
+    gc.freeze()
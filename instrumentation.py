@@ -0,0 +1,195 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+# ---------------- STAGE TIMINGS ----------------
+# A Timings object follows one request through the pipeline. Stages are
+# timed with `with timings.stage("read"):` and sizes are recorded with
+# timings.count("rows_in", n). Stages may overlap (the Excel and PDF
+# builders run at the same time, and "excel" includes "heatmap"), so the
+# durations are not meant to add up to the request time.
+
+class Timings:
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def count(self, name, value):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def server_timing(self):
+        # Server-Timing header value, durations in milliseconds
+        with self._lock:
+            durations = list(self.durations.items())
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations)
+
+
+def stage(timings, name):
+    # Lets pipeline code time a stage whether or not a caller asked for it
+    return timings.stage(name) if timings is not None else nullcontext()
+
+
+def timed_call(fn, *args):
+    # Runs fn in a pool worker and reports how long it took there
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+# ---------------- PROMETHEUS METRICS ----------------
+# A small in-process registry rendered in the Prometheus text format on
+# GET /metrics. Every server process keeps its own values, so with several
+# gunicorn workers each scrape sees the worker that answered it. Work done
+# inside the job and batch pools is not recorded here.
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        label_names = self.labels + ("le",)
+        with self._lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = format_labels(label_names, key + (format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "excel_api_request_seconds", "Time spent handling a request.", ("endpoint",)
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "excel_api_stage_seconds", "Time spent in each processing stage.", ("stage",)
+))
+REQUESTS = REGISTRY.register(Counter(
+    "excel_api_requests_total", "Requests handled.", ("endpoint", "status")
+))
+ROWS = REGISTRY.register(Counter(
+    "excel_api_rows_total", "Rows read from uploads and written to reports.", ("kind",)
+))
+COLUMNS = REGISTRY.register(Counter(
+    "excel_api_columns_total", "Columns read from uploads and written to reports.", ("kind",)
+))
+BYTES = REGISTRY.register(Counter(
+    "excel_api_bytes_total", "Bytes received in uploads and sent as artifacts.", ("direction",)
+))
+
+# Timings.counts name -> (counter, label name, label value)
+COUNT_METRICS = {
+    "rows_in": (ROWS, "kind", "input"),
+    "rows_out": (ROWS, "kind", "output"),
+    "columns_in": (COLUMNS, "kind", "input"),
+    "columns_out": (COLUMNS, "kind", "output"),
+    "bytes_in": (BYTES, "direction", "in"),
+    "bytes_out": (BYTES, "direction", "out"),
+}
+
+
+def record_request(endpoint, status, seconds, timings):
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=str(status))
+    if timings is None:
+        return
+
+    for name, duration in timings.durations.items():
+        STAGE_SECONDS.observe(duration, stage=name)
+    for name, value in timings.counts.items():
+        if name in COUNT_METRICS:
+            counter, label, label_value = COUNT_METRICS[name]
+            counter.inc(value, **{label: label_value})
@@ -0,0 +1,218 @@
+import os
+import json
+import functools
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+
+from pools import ProcessPool, node_share, in_pool_options
+
+
+# ---------------- ASYNC JOBS ----------------
+# Jobs run in a local process pool so HTTP workers stay free. Every job
+# gets its own directory holding the upload, a status.json file and the
+# finished artifacts. State lives on disk, so any HTTP worker process can
+# answer a status or download request for any job.
+#
+# An upload is saved into a staging directory before the queue lock is
+# taken, and only renamed to the job's directory once the job is queued.
+# A job whose pool process dies is marked failed, and the pool is rebuilt.
+# Inside a job, artifacts and sheets go to threads, and JOB_WORKERS and
+# JOB_QUEUE_SIZE are for the whole node (see pools.py).
+
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(tempfile.gettempdir(), "excel-api-jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", os.cpu_count() or 1))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 16))
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 3600))
+JOB_SWEEP_INTERVAL = 60
+
+ARTIFACTS = {
+    "excel": "excel.xlsx",
+    "pdf": "report.pdf",
+    "summary": "summary.json",
+}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def write_json(path, data):
+    # Write to a temp file first so readers never see a half-written file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def update_status(job_dir, **fields):
+    status_path = os.path.join(job_dir, "status.json")
+    status = read_json(status_path)
+    status.update(fields, updated=time.time())
+    write_json(status_path, status)
+    return status
+
+
+def run_job(process_fn, job_dir, input_path, filename, options):
+    # Runs inside a pool process
+    update_status(job_dir, status="running", stage="reading")
+
+    def progress(stage):
+        update_status(job_dir, stage=stage)
+
+    try:
+        with open(input_path, "rb") as stream:
+            result = process_fn(stream, filename, options, progress=progress)
+
+        # An artifact whose builder failed is left out and listed in errors
+        for name in ("excel", "pdf"):
+            if result[name] is not None:
+                with open(os.path.join(job_dir, ARTIFACTS[name]), "wb") as f:
+                    f.write(result[name].getbuffer())
+        summary = {
+            "summary_text": result["summary_text"],
+            "excel_filename": result["excel_filename"],
+            "pdf_filename": result["pdf_filename"],
+            "errors": result["errors"]
+        }
+        if result.get("dataset"):
+            summary["dataset"] = result["dataset"]
+        write_json(os.path.join(job_dir, ARTIFACTS["summary"]), summary)
+
+        os.remove(input_path)
+        update_status(job_dir, status="done", stage="done", errors=result["errors"])
+
+    except Exception as e:
+        update_status(job_dir, status="failed", error=str(e))
+
+
+def job_finished(job_dir, future):
+    # run_job records its own errors, so an exception here means the job
+    # never finished, most likely because its pool process died
+    if future.cancelled() or future.exception() is None:
+        return
+    try:
+        update_status(job_dir, status="failed", error=str(future.exception()))
+    except (OSError, ValueError):
+        pass
+
+
+class JobManager:
+
+    def __init__(self, process_fn, root=JOB_DIR, workers=node_share(JOB_WORKERS),
+                 queue_size=node_share(JOB_QUEUE_SIZE), ttl=JOB_TTL_SECONDS):
+        self.process_fn = process_fn
+        self.root = root
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self._pool = ProcessPool(workers)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _job_dir(self, job_id):
+        # Job ids are uuid hex strings, anything else cannot be a job
+        try:
+            job_id = uuid.UUID(hex=job_id).hex
+        except ValueError:
+            return None
+        return os.path.join(self.root, job_id)
+
+    def _check_queue(self):
+        self._pending = {f for f in self._pending if not f.done()}
+        if len(self._pending) >= self.queue_size:
+            raise QueueFullError("Job queue is full, try again later")
+
+    def submit(self, uploaded_file, options):
+        self.sweep()
+
+        # Checked before the upload is saved too, so a full queue does not
+        # first take in the whole file
+        with self._lock:
+            self._check_queue()
+
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.root, job_id)
+        staging_dir = f"{job_dir}.incoming"
+        os.makedirs(staging_dir)
+
+        filename = uploaded_file.filename
+        input_name = "input" + os.path.splitext(filename or "")[1]
+        try:
+            uploaded_file.save(os.path.join(staging_dir, input_name))
+
+            now = time.time()
+            write_json(os.path.join(staging_dir, "status.json"), {
+                "id": job_id,
+                "filename": filename,
+                "status": "queued",
+                "stage": "queued",
+                "error": None,
+                "created": now,
+                "updated": now
+            })
+
+            with self._lock:
+                self._check_queue()
+                # Renamed before submit, so a running job finds its directory
+                os.rename(staging_dir, job_dir)
+                try:
+                    future = self._pool.submit(
+                        run_job, self.process_fn, job_dir, os.path.join(job_dir, input_name),
+                        filename, in_pool_options(options)
+                    )
+                except Exception:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    raise
+                self._pending.add(future)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        future.add_done_callback(functools.partial(job_finished, job_dir))
+        return job_id
+
+    def status(self, job_id):
+        job_dir = self._job_dir(job_id)
+        if job_dir is None or not os.path.exists(os.path.join(job_dir, "status.json")):
+            return None
+        return read_json(os.path.join(job_dir, "status.json"))
+
+    def artifact_path(self, job_id, name):
+        return os.path.join(self._job_dir(job_id), ARTIFACTS[name])
+
+    def sweep(self, force=False):
+        # Remove job directories that have not been touched for ttl seconds.
+        # This also clears jobs whose pool process died mid-run and
+        # staging directories left by an interrupted upload.
+        now = time.time()
+        if not force and now - self._last_sweep < JOB_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+
+        if not os.path.isdir(self.root):
+            return
+
+        for name in os.listdir(self.root):
+            job_dir = os.path.join(self.root, name)
+            status_path = os.path.join(job_dir, "status.json")
+            try:
+                updated = read_json(status_path)["updated"]
+            except (OSError, ValueError):
+                # A staging directory whose upload never finished
+                if not name.endswith(".incoming"):
+                    continue
+                try:
+                    updated = os.path.getmtime(job_dir)
+                except OSError:
+                    continue
+            if now - updated > self.ttl:
+                shutil.rmtree(job_dir, ignore_errors=True)
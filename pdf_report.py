@@ -0,0 +1,311 @@
+import io
+import os
+import datetime
+import threading
+from xml.sax.saxutils import escape
+
+import pandas as pd
+
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import Flowable, LongTable, PageBreak
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import KeepTogether
+
+
+# ---------------- REPORT TEMPLATE ----------------
+# Everything in the PDF that does not depend on the data is built once per
+# process: the stylesheet and paragraph styles, the table styles, the page
+# header/footer callback and the logo, which is read and decoded a single
+# time and then drawn straight from memory on every report. build_pdf only
+# adds the data flowables. Flowables themselves are created per report,
+# since platypus stores layout state on them while building.
+
+LOGO_PATH = "logo.png"   # Put your logo file in same folder
+LOGO_WIDTH = 3 * inch
+FOOTER_TEXT = "Developed by Tryfon Papadopoulos"
+TOP_MARGIN = 0.6 * inch   # default is usually 1 inch
+
+
+class Logo(Flowable):
+    # Draws the template's shared, already decoded logo image
+
+    def __init__(self, reader, width, height):
+        Flowable.__init__(self)
+        self.reader = reader
+        self.width = width
+        self.height = height
+        self.hAlign = 'CENTER'
+
+    def wrap(self, available_width, available_height):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask="auto")
+
+
+class ReportTemplate:
+
+    def __init__(self, logo_path=LOGO_PATH, footer_text=FOOTER_TEXT):
+        self.footer_text = footer_text
+
+        self.styles = getSampleStyleSheet()
+        self.custom_style = ParagraphStyle(
+            'CustomNormal',
+            parent=self.styles['Normal'],
+            spaceAfter=6,  # points (6pt = subtle spacing)
+        )
+        self.centered_heading = ParagraphStyle(
+            name='CenteredHeading',
+            parent=self.styles['Heading2'],
+            alignment=TA_CENTER)
+
+        self.line_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.black)
+        ])
+        self.table_style = TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.grey),
+            ('GRID', (0,0), (-1,-1), 1, colors.black)
+        ])
+        self.stats_table_style = TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.grey),
+            ('GRID', (0,0), (-1,-1), 1, colors.black),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+            ('ALIGN', (1,1), (-1,-1), 'CENTER'),
+        ])
+
+        # Decode the logo now so no report pays for it
+        self.logo = None
+        if os.path.exists(logo_path):
+            with open(logo_path, "rb") as f:
+                self.logo = ImageReader(io.BytesIO(f.read()))
+            self.logo.getRGBData()
+
+    def new_document(self, buffer, invariant=False):
+        # invariant fixes the creation date and document id reportlab
+        # writes, for deterministic reports
+        return SimpleDocTemplate(buffer, topMargin=TOP_MARGIN, invariant=1 if invariant else 0)
+
+    def header_elements(self, doc):
+        elements = []
+
+        # -------- LOGO (TOP CENTERED) --------
+        if self.logo is not None:
+            # Smaller controlled size (clean, not dominant)
+            elements.append(Logo(self.logo, LOGO_WIDTH, LOGO_WIDTH * 83 / 516))
+            elements.append(Spacer(1, 0.08 * inch))
+
+        # -------- LINE --------
+        elements.append(Spacer(1, 0.1 * inch))
+        line = Table([[""]], colWidths=[doc.width], rowHeights=[1])
+        line.setStyle(self.line_style)
+        elements.append(line)
+
+        elements.append(Spacer(1, 0.2 * inch))
+        return elements
+
+    def on_page(self, canvas, doc):
+        canvas.saveState()
+
+        canvas.line(
+            doc.leftMargin,
+            0.75 * inch,
+            doc.width + doc.rightMargin,
+            0.75 * inch
+        )
+
+        # -------- FOOTER --------
+        canvas.setFont("Helvetica", 9)
+
+        # Left footer (developer credit)
+        canvas.drawString(doc.leftMargin, 0.5 * inch, self.footer_text)
+
+        # Right footer (page number)
+        canvas.drawRightString(doc.width + doc.rightMargin, 0.5 * inch, f"Page {doc.page}")
+
+        canvas.restoreState()
+
+    def build(self, doc, elements):
+        doc.build(elements, onFirstPage=self.on_page, onLaterPages=self.on_page)
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def report_template():
+    # Built on first use, then shared by every report in this process
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = ReportTemplate()
+    return _template
+
+
+# ---------------- LARGE TABLES ----------------
+# Small tables are kept whole on one page as before. A table longer than
+# PDF_LONG_TABLE_ROWS is drawn as a LongTable that splits across pages with
+# its header row repeated, because KeepTogether on a table that cannot fit
+# makes ReportLab retry the split over and over. Frequency tables are cut
+# to the PDF_TOP_N most frequent values plus one "Other" row holding the
+# rest (0 keeps every value). The Excel report always has the full tables.
+
+PDF_LONG_TABLE_ROWS = int(os.environ.get("PDF_LONG_TABLE_ROWS", 50))
+PDF_TOP_N = int(os.environ.get("PDF_TOP_N", 50))
+
+
+def top_n_rows(freq_df, n=PDF_TOP_N):
+    # freq_df is a frequency table (label, Count), largest counts first
+    if n <= 0 or len(freq_df) <= n:
+        return freq_df
+
+    rest = freq_df.iloc[n:]
+    other = pd.DataFrame(
+        [[f"Other ({len(rest)} values)", rest["Count"].sum()]],
+        columns=freq_df.columns
+    )
+    return pd.concat([freq_df.iloc[:n], other], ignore_index=True)
+
+
+def table_flowable(table_data, style, col_widths=None, repeat_rows=0):
+    if len(table_data) - 1 > PDF_LONG_TABLE_ROWS:
+        table = LongTable(table_data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(style)
+        return table
+
+    table = Table(table_data, colWidths=col_widths, repeatRows=repeat_rows)
+    table.setStyle(style)
+    return KeepTogether(table)
+
+
+# ---------------- PDF GENERATION ----------------
+def title_elements(template, original_filename, excel_filename, pdf_filename, report_id=None):
+    styles = template.styles
+    elements = []
+
+    # -------- TITLE --------
+    elements.append(Paragraph("Excel Data Analysis Report", styles['Title']))
+    elements.append(Spacer(1, 0.3 * inch))
+
+    elements.append(Paragraph(f"Original File: {original_filename}", styles['Normal']))
+    elements.append(Paragraph(f"Processed Excel File: {excel_filename}", styles['Normal']))
+    elements.append(Paragraph(f"Generated PDF File: {pdf_filename}", styles['Normal']))
+    if report_id:
+        elements.append(Paragraph(f"Report ID: {report_id}", styles['Normal']))
+    else:
+        elements.append(Paragraph(f"Generated On: {datetime.datetime.now()}", styles['Normal']))
+    elements.append(Spacer(1, 0.4 * inch))
+    return elements
+
+
+def report_elements(template, doc, summary_text, summary_df, null_df, stats_df, frequencies):
+    # Summary text and tables of one processed sheet. frequencies is the
+    # list of frequency tables to show; each table header holds its label.
+    centered_heading = template.centered_heading
+    elements = []
+
+    for line in summary_text.split("\n"):
+        if line.strip():
+            elements.append(Paragraph(line.strip(), template.custom_style))
+
+    table_data = summary_df.values.tolist()
+    table_data.insert(0, list(summary_df.columns))
+
+    elements.append(Spacer(1, 0.2 * inch))
+    elements.append(Paragraph("Summary Metrics", centered_heading))
+    elements.append(Spacer(1, 0.15 * inch))
+
+    elements.append(table_flowable(table_data, template.table_style))
+
+    # A) NULL COUNTS TABLE
+    elements.append(Spacer(1, 0.3 * inch))
+    elements.append(Paragraph("Null Values per Column", centered_heading))
+    elements.append(Spacer(1, 0.15 * inch))
+
+    null_table_data = null_df.values.tolist()
+    null_table_data.insert(0, list(null_df.columns))
+
+    elements.append(table_flowable(null_table_data, template.table_style))
+
+    # B) NUMERIC STATISTICS TABLE
+    if not stats_df.empty:
+        elements.append(Spacer(1, 0.3 * inch))
+        elements.append(Paragraph("Numeric Statistics", centered_heading))
+        elements.append(Spacer(1, 0.15 * inch))
+
+        stats_table_data = stats_df.reset_index().values.tolist()
+        stats_table_data.insert(0, ["Column"] + list(stats_df.columns))
+
+        available_width = doc.width
+        num_cols = len(stats_table_data[0])
+        col_width = available_width / num_cols
+
+        elements.append(table_flowable(
+            stats_table_data,
+            template.stats_table_style,
+            col_widths=[col_width] * num_cols,
+            repeat_rows=1
+        ))
+
+    # C) FREQUENCY TABLES
+    for freq in frequencies:
+        elements.append(Spacer(1, 0.3 * inch))
+        elements.append(Paragraph(f"{escape(str(freq.columns[0]))} Frequency", centered_heading))
+        elements.append(Spacer(1, 0.15 * inch))
+
+        freq_rows = top_n_rows(freq)
+        freq_table_data = freq_rows.values.tolist()
+        freq_table_data.insert(0, list(freq_rows.columns))
+
+        elements.append(table_flowable(freq_table_data, template.table_style))
+
+    return elements
+
+
+def build_pdf(original_filename, excel_filename, pdf_filename, summary_text,
+              summary_df, null_df, stats_df, frequencies, report_id=None):
+    # report_id is set for deterministic reports, see pipeline.py
+    template = report_template()
+
+    pdf_buffer = io.BytesIO()
+    doc = template.new_document(pdf_buffer, invariant=report_id is not None)
+    elements = template.header_elements(doc)
+    elements += title_elements(template, original_filename, excel_filename, pdf_filename, report_id)
+    elements += report_elements(
+        template, doc, summary_text, summary_df, null_df, stats_df, frequencies
+    )
+
+    template.build(doc, elements)
+
+    return pdf_buffer
+
+
+def build_sheets_pdf(original_filename, excel_filename, pdf_filename, sections, report_id=None):
+    # One report for a multi-sheet workbook. sections holds, per sheet,
+    # (sheet_name, summary_text, summary_df, null_df, stats_df, frequencies)
+    # and every sheet starts on a new page under its own heading.
+    template = report_template()
+
+    pdf_buffer = io.BytesIO()
+    doc = template.new_document(pdf_buffer, invariant=report_id is not None)
+    elements = template.header_elements(doc)
+    elements += title_elements(template, original_filename, excel_filename, pdf_filename, report_id)
+    elements.append(Paragraph(
+        f"Sheets Processed: {escape(', '.join(str(section[0]) for section in sections))}",
+        template.styles['Normal']
+    ))
+
+    for sheet_name, *tables in sections:
+        elements.append(PageBreak())
+        elements.append(Paragraph(f"Sheet: {escape(str(sheet_name))}", template.styles['Heading1']))
+        elements.append(Spacer(1, 0.15 * inch))
+        elements += report_elements(template, doc, *tables)
+
+    template.build(doc, elements)
+
+    return pdf_buffer
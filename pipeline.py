@@ -0,0 +1,944 @@
+import io
+import os
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from readers import read_upload, iter_chunks, UploadError
+from dedup import drop_duplicate_rows, row_fingerprints, DuplicateTracker
+from excel_report import build_excel, build_excel_sections, section_prefixes, StreamingWorkbook, EXCEL_WRITE_MODE
+from excel_report import stable_xlsx
+from stats import StreamingStats, frequency_table, quality_score_for, sorted_counts
+from instrumentation import stage, timed_call
+from rules import COLUMN_RULES, RULE_DEFAULTS
+from cache import cache_key
+from datasets import DATASETS, key_column, column_kind, key_hashes, merge_removable, in_sorted, match_rows, row_diff, sort_fingerprints
+from pools import ProcessPool, node_share
+
+
+# ---------------- VALUE STANDARDIZATION HELPERS ----------------
+# Text columns with few distinct values (at most CATEGORY_MAX_RATIO of the
+# rows, 0 turns it off) come out of standardization as pandas categoricals:
+# integer codes plus one copy of every distinct string. Dedup hashing, null
+# counts and frequency counts then run on the codes, and the strings are
+# only looked up again when the artifacts are written.
+CATEGORY_MAX_RATIO = float(os.environ.get("CATEGORY_MAX_RATIO", 0.5))
+
+
+def normalize_values(values, rule=RULE_DEFAULTS):
+    # strip -> collapse inner whitespace -> case -> regex replacements ->
+    # blank to NaN, each step only if the column rule asks for it
+    values = pd.Series(values, dtype=object).astype(str)
+    if rule["trim"]:
+        values = values.str.strip().str.replace(r'\s+', ' ', regex=True)
+    if rule["case"] == "lower":
+        values = values.str.lower()
+    elif rule["case"] == "upper":
+        values = values.str.upper()
+    for regex, replacement in rule["replace"]:
+        values = values.str.replace(regex, replacement, regex=True)
+    return values.where(values != '', None)
+
+
+def standardize_text(series, rule=RULE_DEFAULTS):
+    # Factorize first, so all the text rules of the column run once per
+    # distinct value and the results are mapped back through the integer
+    # codes. Real NaN values get code -1 and stay missing.
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+
+    cleaned = normalize_values(np.asarray(uniques, dtype=object), rule)
+
+    if len(uniques) <= CATEGORY_MAX_RATIO * len(series):
+        # Cleaning can merge values ("a " and "A"), so the cleaned uniques
+        # are factorized again and the codes remapped through them
+        cleaned_codes, categories = pd.factorize(cleaned, use_na_sentinel=True)
+        codes = np.append(cleaned_codes, -1)[codes]
+        return pd.Series(
+            pd.Categorical.from_codes(codes, categories=categories),
+            index=series.index, name=series.name
+        )
+
+    lookup = np.append(cleaned.to_numpy(dtype=object), None)
+
+    values = lookup[codes]   # code -1 picks the trailing None
+    dtype = None if series.dtype == object else series.dtype
+    return pd.Series(values, index=series.index, dtype=dtype, name=series.name)
+
+
+def coerce_column(series, column_type):
+    if column_type == "numeric":
+        return pd.to_numeric(series, errors="coerce")
+    if column_type == "datetime":
+        return pd.to_datetime(series, errors="coerce")
+    # "text": values kept as they are, so the text rules apply to them
+    return series.astype(object)
+
+
+def format_row_numbers(index, limit=50):
+    # Source-file row numbers (row 1 is the header) for the summary text
+    numbers = [str(label + 2) for label in index[:limit]]
+    if len(index) > limit:
+        numbers.append(f"... and {len(index) - limit} more")
+    return ", ".join(numbers)
+
+
+# ---------------- PROCESSING PIPELINE ----------------
+CHUNK_ROWS = 50000
+
+
+def upper_columns(df):
+    return [col.strip().upper() for col in df.columns]
+
+
+def clean_frame(df, timings=None):
+    # ---------------- CLEANING ----------------
+    with stage(timings, "clean"):
+        df = df.dropna(how='all')
+        df.columns = upper_columns(df)
+        # Clean duplicated column names like AGE.1
+        df.columns = df.columns.str.replace(r'\.\d+$', '', regex=True)
+
+        # Remove duplicate columns (before standardization, so dropped
+        # columns are never normalized)
+        df = df.loc[:, ~df.columns.duplicated()]
+
+    # ---------------- VALUE STANDARDIZATION ----------------
+    # Formatting rules per column come from rules.COLUMN_RULES
+    with stage(timings, "standardize"):
+        for col in df.columns:
+            rule = COLUMN_RULES.rule_for(col)
+            if rule["type"]:
+                df[col] = coerce_column(df[col], rule["type"])
+
+            if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+                df[col] = standardize_text(df[col], rule)
+
+    return df
+
+
+# ---------------- SELECTIVE OUTPUTS ----------------
+# outputs= (comma separated, default all three) picks which of the summary
+# text, the xlsx and the PDF a request wants; the summary always comes
+# back. Work that only an unrequested artifact needs is never run: without
+# the xlsx and the PDF there are no report tables, numeric statistics,
+# frequency tables or workbook, just cleaning, deduplication and the null
+# counts behind the summary. heatmap=0 and charts=0 leave those xlsx
+# sections out, and frequencies=0 skips the frequency tables everywhere
+# (which columns get one is up to the column rules).
+OUTPUTS = ("summary", "excel", "pdf")
+
+
+def selected_outputs(value):
+    if not value:
+        return set(OUTPUTS)
+    outputs = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = sorted(outputs - set(OUTPUTS))
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(unknown)}")
+    return outputs | {"summary"}
+
+
+def report_plan(options):
+    outputs = selected_outputs(options.get("outputs"))
+    tables = "excel" in outputs or "pdf" in outputs
+    return {
+        "outputs": outputs,
+        "tables": tables,
+        "frequencies": tables and options.get("frequencies", True),
+        "heatmap": options.get("heatmap", True),
+        "charts": options.get("charts", True),
+    }
+
+
+def frequency_columns_for(plan, columns):
+    return COLUMN_RULES.frequency_columns(columns) if plan["frequencies"] else {}
+
+
+def compute_metrics(df, frequency_columns=None, details=True):
+    # details=False only counts what the summary text needs
+    num_rows = len(df)
+    num_columns = len(df.columns)
+    null_counts = df.isnull().sum()
+    total_cells = df.size
+    total_nulls = null_counts.sum()
+    quality_score = quality_score_for(total_nulls, total_cells)
+
+    numeric_df = df.select_dtypes(include='number') if details else pd.DataFrame()
+    stats_df = pd.DataFrame()
+
+    if not numeric_df.empty:
+        stats_df = pd.DataFrame({
+            "Mean": numeric_df.mean().round(2),
+            "Median": numeric_df.median().round(2),
+            "Std Dev": numeric_df.std().round(2),
+            "Min": numeric_df.min().round(2),
+            "Max": numeric_df.max().round(2)
+        })
+
+    metrics = {
+        "num_rows": num_rows,
+        "num_columns": num_columns,
+        "null_counts": null_counts,
+        "total_nulls": total_nulls,
+        "quality_score": quality_score,
+        "stats_df": stats_df,
+    }
+
+    # column -> frequency table, for the columns picked by the rules
+    metrics["frequencies"] = {
+        col: frequency_table(sorted_counts(df[col]), label)
+        for col, label in (frequency_columns or {}).items()
+    }
+
+    return metrics
+
+
+def add_summary_tables(metrics):
+    metrics["summary_df"] = pd.DataFrame({
+        "Metric": [
+            "Rows",
+            "Columns",
+            "Duplicate Rows Removed",
+            "Total Null Values",
+            "Data Quality Score (%)"
+        ],
+        "Value": [
+            metrics["num_rows"],
+            metrics["num_columns"],
+            metrics["duplicate_rows"],
+            metrics["total_nulls"],
+            metrics["quality_score"]
+        ]
+    })
+
+    # Approximate mode states its error bounds next to the metrics
+    error_bounds = metrics.get("error_bounds", {})
+    if error_bounds:
+        bounds_df = pd.DataFrame({
+            "Metric": list(error_bounds),
+            "Value": list(error_bounds.values())
+        })
+        metrics["summary_df"] = pd.concat([metrics["summary_df"], bounds_df], ignore_index=True)
+
+    null_df = metrics["null_counts"].reset_index()
+    null_df.columns = ["Column", "Null Count"]
+    if "distinct_counts" in metrics:
+        null_df["Distinct Values (approx)"] = metrics["distinct_counts"].reindex(null_df["Column"]).to_numpy()
+    metrics["null_df"] = null_df
+    return metrics
+
+
+def build_summary_text(original_filename, original_columns_list, processed_columns_list,
+                       excel_filename, metrics):
+    original_columns_count = len(original_columns_list)
+    processed_columns_count = len(processed_columns_list)
+    num_rows = metrics["num_rows"]
+    quality_score = metrics["quality_score"]
+    duplicate_rows = metrics["duplicate_rows"]
+    total_nulls = metrics["total_nulls"]
+
+    # Detect removed columns
+    removed_columns = list(set(original_columns_list) - set(processed_columns_list))
+
+    # ---------------- AI STYLE SUMMARY TEXT ----------------
+    summary_text = f"""
+        The uploaded file '{original_filename}' originally contained {original_columns_count} columns.
+
+        Original Columns:
+        {", ".join(original_columns_list)}
+
+        After cleaning and standardization, the processed dataset ('{excel_filename}') contains {num_rows} rows and {processed_columns_count} columns.
+
+        Processed Columns:
+        {", ".join(processed_columns_list)}
+        """
+
+    if removed_columns:
+        summary_text += f"\nColumns Removed: {', '.join(removed_columns)}"
+    else:
+        summary_text += "\nColumns Removed: None"
+
+    summary_text += f"""
+
+        Data Quality Score: {quality_score}%.
+        Duplicate Rows Removed: {duplicate_rows}.
+        Total Null Values: {total_nulls}.
+        """
+
+    if duplicate_rows:
+        summary_text += f"Duplicate Row Numbers: {format_row_numbers(metrics['duplicate_index'])}\n"
+
+    error_bounds = metrics.get("error_bounds")
+    if error_bounds:
+        summary_text += (
+            "Approximate statistics: medians within "
+            f"±{error_bounds['Median Rank Error (±%)']}% rank, distinct counts within "
+            f"±{error_bounds['Distinct Count Std Error (±%)']}%, frequency counts low by at most "
+            f"{error_bounds['Frequency Count Error (max)']}.\n"
+        )
+
+    diff = metrics.get("dataset")
+    if diff:
+        summary_text += (
+            f"Dataset '{diff['name']}' version {diff['version']}: {diff['rows_added']} rows added, "
+            f"{diff['rows_removed']} removed, {diff['rows_changed']} changed and "
+            f"{diff['rows_unchanged']} unchanged since the previous version; "
+            f"{diff['rows_processed']} rows processed.\n"
+        )
+
+    return summary_text
+
+
+def frequency_sheets(metrics):
+    # (column, table, chart) for every non-empty frequency table
+    return [
+        (col, table, COLUMN_RULES.rule_for(col)["chart"])
+        for col, table in metrics["frequencies"].items() if not table.empty
+    ]
+
+
+def pdf_frequencies(metrics):
+    return [
+        table for col, table in metrics["frequencies"].items()
+        if not table.empty and COLUMN_RULES.rule_for(col)["pdf"]
+    ]
+
+
+def excel_tables(metrics):
+    return (metrics["summary_df"], metrics["stats_df"], metrics["null_df"],
+            frequency_sheets(metrics), metrics["quality_score"])
+
+
+# ---------------- ARTIFACT GENERATION ----------------
+# The xlsx and PDF builders only share read-only inputs, so they run at the
+# same time. The Excel builder stays in the calling thread because it needs
+# the full frame; the PDF builder only needs the small report tables, which
+# are cheap to hand to a thread or process pool. Each builder's failure is
+# caught separately, so one broken artifact does not lose the other.
+# ARTIFACT_WORKERS is for the whole node (see pools.py).
+ARTIFACT_EXECUTOR = os.environ.get("ARTIFACT_EXECUTOR", "thread")
+ARTIFACT_EXECUTORS = ("serial", "thread", "process")
+ARTIFACT_WORKERS = int(os.environ.get("ARTIFACT_WORKERS", os.cpu_count() or 1))
+
+_artifact_pools = {}
+_artifact_pools_lock = threading.Lock()
+
+
+# reportlab is only imported once a PDF is actually built (or by warm_up),
+# so processes that never write one do not pay for it. Module-level
+# wrappers, so the process pool can still pickle them.
+def build_pdf(*args):
+    from pdf_report import build_pdf as build
+    return build(*args)
+
+
+def build_sheets_pdf(*args):
+    from pdf_report import build_sheets_pdf as build
+    return build(*args)
+
+
+def artifact_pool(kind):
+    # The process pool is rebuilt if one of its workers dies (see pools.py)
+    with _artifact_pools_lock:
+        if kind not in _artifact_pools:
+            if kind == "process":
+                _artifact_pools[kind] = ProcessPool(node_share(ARTIFACT_WORKERS))
+            else:
+                _artifact_pools[kind] = ThreadPoolExecutor(max_workers=node_share(ARTIFACT_WORKERS))
+        return _artifact_pools[kind]
+
+
+def build_artifacts(excel_builder, pdf_args, executor=ARTIFACT_EXECUTOR, pdf_builder=build_pdf,
+                    timings=None, stable=False):
+    if executor not in ARTIFACT_EXECUTORS:
+        raise ValueError(f"Unknown artifact executor '{executor}'")
+
+    # excel_builder or pdf_args is None when that artifact is not wanted
+    artifacts = {}
+    errors = {}
+
+    pdf_future = None
+    if pdf_args is not None and executor != "serial":
+        # Timed where it runs, so queueing in the pool is not counted
+        pdf_future = artifact_pool(executor).submit(timed_call, pdf_builder, *pdf_args)
+
+    if excel_builder is not None:
+        try:
+            with stage(timings, "excel"):
+                artifacts["excel"] = excel_builder()
+                if stable:
+                    artifacts["excel"] = stable_xlsx(artifacts["excel"])
+        except Exception as e:
+            errors["excel"] = str(e)
+
+    if pdf_args is not None:
+        try:
+            if pdf_future:
+                artifacts["pdf"], seconds = pdf_future.result()
+                if timings is not None:
+                    timings.add("pdf", seconds)
+            else:
+                with stage(timings, "pdf"):
+                    artifacts["pdf"] = pdf_builder(*pdf_args)
+        except Exception as e:
+            errors["pdf"] = str(e)
+
+    if errors and not artifacts:
+        raise RuntimeError("; ".join(f"{name}: {error}" for name, error in errors.items()))
+
+    return artifacts, errors
+
+
+def finish_report(original_filename, original_columns_list, processed_columns_list,
+                  excel_builder, metrics, options, report, timings=None):
+    report_id = options.get("report_id")
+    excel_filename = new_excel_filename(report_id)
+    summary_text = build_summary_text(
+        original_filename, original_columns_list, processed_columns_list,
+        excel_filename, metrics
+    )
+
+    # ---------------- EXCEL + PDF GENERATION ----------------
+    report("artifacts")
+    outputs = selected_outputs(options.get("outputs"))
+    pdf_filename = new_pdf_filename(report_id)
+    pdf_args = None
+    if "pdf" in outputs:
+        pdf_args = (
+            original_filename, excel_filename, pdf_filename, summary_text,
+            metrics["summary_df"], metrics["null_df"], metrics["stats_df"], pdf_frequencies(metrics),
+            report_id
+        )
+    artifacts, errors = build_artifacts(
+        excel_builder if "excel" in outputs else None, pdf_args,
+        executor=options.get("artifact_executor") or ARTIFACT_EXECUTOR,
+        timings=timings,
+        stable=report_id is not None
+    )
+
+    return report_result(artifacts, errors, summary_text, excel_filename, pdf_filename, report_id)
+
+
+def report_result(artifacts, errors, summary_text, excel_filename, pdf_filename, report_id=None):
+    return {
+        "excel": artifacts.get("excel"),
+        "pdf": artifacts.get("pdf"),
+        "summary_text": summary_text,
+        "excel_filename": excel_filename,
+        "pdf_filename": pdf_filename,
+        "errors": errors,
+        "report_id": report_id
+    }
+
+
+# ---------------- DETERMINISTIC REPORTS ----------------
+# With options["deterministic"] the output depends only on the uploaded
+# bytes, the upload's file name, the options and the server config. The
+# report id is their hash (the result cache key): it replaces the time in the file names and
+# the "Generated On" line of the PDF, the PDF is written with reportlab's
+# invariant dates and ids, and the xlsx gets fixed zip and document
+# timestamps. Identical requests
+# then return byte-identical artifacts, which the app turns into an ETag.
+REPORT_ID_CHARS = 16
+
+
+def with_report_id(stream, original_filename, options):
+    # The app passes the id in when it has hashed the upload already
+    if not options.get("deterministic") or options.get("report_id"):
+        return options
+    return dict(options, report_id=cache_key(stream, original_filename, options))
+
+
+def file_stamp(report_id):
+    if report_id:
+        return report_id[:REPORT_ID_CHARS]
+    return datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+
+
+def new_excel_filename(report_id=None):
+    return f"processed_{file_stamp(report_id)}.xlsx"
+
+
+def new_pdf_filename(report_id=None):
+    return f"report_{file_stamp(report_id)}.pdf"
+
+
+def analyze_frame(df, report=None, timings=None, plan=None):
+    # Cleaning, deduplication and metrics of one sheet. A plain module-level
+    # function, so the per-sheet pool can also be a process pool.
+    #
+    # Always exact: with the whole frame in memory the pandas reductions are
+    # cheaper than feeding the same rows to sketches, so the app refuses
+    # approx=1 without chunked=1 (see stats.py).
+    report = report or (lambda stage: None)
+    plan = plan or report_plan({})
+
+    # Capture original columns
+    original_columns_list = upper_columns(df)
+
+    report("cleaning")
+    df = clean_frame(df, timings)
+
+    # Remove duplicate rows (one fingerprint per row for count and removal)
+    with stage(timings, "dedup"):
+        df, duplicate_index = drop_duplicate_rows(df)
+
+    # ---------------- METRICS ----------------
+    report("metrics")
+    with stage(timings, "metrics"):
+        metrics = compute_metrics(df, frequency_columns_for(plan, df.columns), details=plan["tables"])
+        metrics["duplicate_rows"] = len(duplicate_index)
+        metrics["duplicate_index"] = duplicate_index
+        if plan["tables"]:
+            add_summary_tables(metrics)
+
+    return original_columns_list, df, metrics
+
+
+def count_frame(timings, direction, df):
+    if timings is not None:
+        timings.count(f"rows_{direction}", len(df))
+        timings.count(f"columns_{direction}", len(df.columns))
+
+
+def process_file(stream, original_filename, options, progress=None, timings=None):
+    # progress(stage) lets async jobs report which stage is running, and
+    # timings (an instrumentation.Timings) collects stage durations and sizes
+    report = progress or (lambda stage: None)
+    options = with_report_id(stream, original_filename, options)
+
+    if options.get("dataset"):
+        return process_file_versioned(stream, original_filename, options, report, timings)
+
+    if options.get("chunked"):
+        return process_file_chunked(stream, original_filename, options, report, timings)
+
+    if options.get("sheets"):
+        return process_file_sheets(stream, original_filename, options, report, timings)
+
+    with stage(timings, "read"):
+        df = read_upload(
+            stream,
+            original_filename,
+            engine=options.get("reader_engine"),
+            dtype_backend=options.get("dtype_backend")
+        )
+    # Same check as the chunked and per-sheet runs: a blank sheet, no header
+    if not len(df.columns):
+        raise UploadError("The uploaded file contains no data")
+    count_frame(timings, "in", df)
+
+    plan = report_plan(options)
+    original_columns_list, df, metrics = analyze_frame(df, report, timings, plan)
+    count_frame(timings, "out", df)
+
+    def excel_builder():
+        return build_excel(
+            df, *excel_tables(metrics),
+            mode=options.get("excel_mode", EXCEL_WRITE_MODE),
+            timings=timings,
+            heatmap=plan["heatmap"],
+            charts=plan["charts"]
+        )
+
+    return finish_report(
+        original_filename, original_columns_list, list(df.columns),
+        excel_builder, metrics, options, report, timings
+    )
+
+
+def process_file_chunked(stream, original_filename, options, report, timings=None):
+    # Out-of-core variant: each chunk is cleaned, deduplicated against every
+    # earlier chunk, folded into the streaming statistics and appended to
+    # the DATA sheet, so memory is bounded by the chunk size.
+    chunk_rows = int(options.get("chunk_rows") or CHUNK_ROWS)
+
+    plan = report_plan(options)
+    tracker = DuplicateTracker()
+    stats = None
+    workbook = None
+    if "excel" in plan["outputs"]:
+        workbook = StreamingWorkbook(timings=timings, heatmap=plan["heatmap"], charts=plan["charts"])
+    original_columns_list = None
+
+    report("cleaning")
+    chunks = iter_chunks(
+        stream,
+        original_filename,
+        chunk_rows=chunk_rows,
+        engine=options.get("reader_engine"),
+        dtype_backend=options.get("dtype_backend")
+    )
+    while True:
+        # Reading is lazy, so every chunk is timed as it is pulled in
+        with stage(timings, "read"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+
+        if original_columns_list is None:
+            original_columns_list = upper_columns(chunk)
+            if timings is not None:
+                timings.count("columns_in", len(chunk.columns))
+        if timings is not None:
+            timings.count("rows_in", len(chunk))
+
+        chunk = clean_frame(chunk, timings)
+        if stats is None:
+            # Frequency columns are picked from the cleaned column names
+            stats = StreamingStats(
+                frequency_columns=frequency_columns_for(plan, chunk.columns),
+                approx=options.get("approx", False),
+                details=plan["tables"]
+            )
+        with stage(timings, "dedup"):
+            chunk = tracker.filter(chunk)
+        with stage(timings, "metrics"):
+            stats.update(chunk)
+        if workbook is not None:
+            with stage(timings, "excel"):
+                workbook.append_data(chunk)
+
+        if timings is not None:
+            timings.count("rows_out", len(chunk))
+
+    if original_columns_list is None:
+        raise UploadError("The uploaded file contains no data")
+    if timings is not None:
+        timings.count("columns_out", len(stats.columns))
+
+    # ---------------- METRICS ----------------
+    report("metrics")
+    with stage(timings, "metrics"):
+        metrics = stats.metrics()
+        metrics["duplicate_rows"] = tracker.duplicates
+        metrics["duplicate_index"] = pd.Index(tracker.duplicate_index)
+        if plan["tables"]:
+            add_summary_tables(metrics)
+
+    # workbook is None exactly when the xlsx is not wanted, and then
+    # finish_report never calls the builder
+    return finish_report(
+        original_filename, original_columns_list, stats.columns,
+        lambda: workbook.finish(*excel_tables(metrics)), metrics, options, report, timings
+    )
+
+
+# ---------------- DATASET VERSIONS ----------------
+# See datasets.py. The statistics are always exact and kept with every
+# table, whatever this request asks for, so the next version can use them.
+
+def rebuild_reason(previous, df, key, rules, kinds):
+    # Why the previous state cannot be reused, or None when it can
+    if previous is None:
+        return "first version"
+    if previous["columns"] != list(df.columns):
+        return "columns changed"
+    if previous["key"] != key:
+        return "key column changed"
+    if previous["rules"] != rules:
+        return "column rules changed"
+    if previous.get("kinds") != kinds:
+        return "column types changed"
+    return None
+
+
+def update_dataset(df, previous, key, clean_all=False, timings=None):
+    # Returns the duplicate index, the statistics, the new state and the
+    # diff against the previous version, and with clean_all the cleaned,
+    # deduplicated frame (every row is cleaned then, not just new ones)
+    key = key_column(df.columns, key)
+    rules = {col: COLUMN_RULES.rule_for(col) for col in upper_columns(df)}
+    kinds = [column_kind(df[col]) for col in df.columns]
+
+    with stage(timings, "diff"):
+        # Hashed like deduplication, so a column that gains a blank (and is
+        # read as floats from then on) does not change every row
+        fingerprints = sort_fingerprints(row_fingerprints(df))
+        keys = key_hashes(df[key]) if key is not None else None
+        reason = rebuild_reason(previous, df, key, rules, kinds)
+        matched = np.full(len(df), -1)
+        if reason is None:
+            matched = match_rows(previous["fingerprints"], fingerprints)
+        added = matched < 0
+
+    # Rows seen before keep the cleaned fingerprint they got then (all-empty
+    # ones were dropped then and are dropped now), the rest is cleaned here
+    if clean_all:
+        cleaned = clean_frame(df, timings)
+        new_rows = cleaned[added[cleaned.index]]
+    else:
+        new_rows = clean_frame(df[added], timings)
+
+    with stage(timings, "dedup"):
+        new_hashes = row_fingerprints(new_rows)
+        row_hashes = np.zeros(len(df), dtype=np.uint64)
+        kept = np.zeros(len(df), dtype=bool)
+        if reason is None:
+            row_hashes[~added] = previous["row_hashes"][matched[~added]]
+            kept[~added] = previous["kept"][matched[~added]]
+        row_hashes[new_rows.index] = new_hashes
+        kept[new_rows.index] = True
+
+        live = np.flatnonzero(kept)
+        duplicated = pd.Series(row_hashes[live]).duplicated().to_numpy()
+        first = live[~duplicated]
+        order = np.argsort(row_hashes[first])
+        unique_hashes = row_hashes[first][order]
+
+    with stage(timings, "metrics"):
+        if reason is None:
+            stats = previous["stats"]
+            old_hashes, old_rows = previous["unique_hashes"], previous["removable"]
+        else:
+            stats = StreamingStats(frequency_columns=COLUMN_RULES.frequency_columns(new_rows.columns))
+            old_hashes, old_rows = np.empty(0, dtype=np.uint64), None
+
+        # Only distinct cleaned rows that left or joined the deduplicated
+        # set count; the ones that joined are all new rows
+        gone = ~in_sorted(unique_hashes, old_hashes)
+        if gone.any():
+            stats.remove(old_rows[gone])
+            old_hashes, old_rows = old_hashes[~gone], old_rows[~gone]
+        joins = ~pd.Series(new_hashes).duplicated().to_numpy() & ~in_sorted(old_hashes, new_hashes)
+        stats.update(new_rows[joins])
+
+        # Leaves them keyed by unique_hashes: the rows kept plus the joins
+        _, removable = merge_removable(
+            old_hashes, old_rows, new_hashes[joins], stats.removable_rows(new_rows[joins])
+        )
+
+        # Frequency ties go by first appearance in this version, as in a
+        # full run, not in the version a value was first counted in
+        positions = np.empty(len(order), dtype=np.intp)
+        positions[order] = np.arange(len(order))
+        for col in stats.frequencies:
+            stats.order_frequencies(col, removable[col].iloc[positions])
+
+    # Rows can be compared whenever the header stayed the same
+    if previous is not None and previous["columns"] == list(df.columns):
+        previous_keys = previous["keys"] if previous["key"] == key else None
+        diff = row_diff(previous["fingerprints"], fingerprints, previous_keys, keys)
+    else:
+        diff = row_diff(sort_fingerprints(np.empty(0, dtype=np.uint64)), fingerprints)
+    diff.update(
+        version=(previous["version"] + 1) if previous else 1,
+        rows_processed=int(added.sum()),
+        rebuilt=reason,
+    )
+
+    state = {
+        "version": diff["version"],
+        "columns": list(df.columns),
+        "key": key,
+        "rules": rules,
+        "kinds": kinds,
+        "fingerprints": fingerprints,
+        "keys": keys,
+        "row_hashes": row_hashes,
+        "kept": kept,
+        "unique_hashes": unique_hashes,
+        "removable": removable,
+        "stats": stats,
+    }
+    deduped = cleaned.loc[df.index[first]] if clean_all else None
+    return deduped, df.index[live[duplicated]], stats, state, diff
+
+
+def process_file_versioned(stream, original_filename, options, report, timings=None):
+    name = options["dataset"]
+    with stage(timings, "read"):
+        df = read_upload(
+            stream,
+            original_filename,
+            engine=options.get("reader_engine"),
+            dtype_backend=options.get("dtype_backend")
+        )
+    count_frame(timings, "in", df)
+
+    plan = report_plan(options)
+    original_columns_list = upper_columns(df)
+
+    report("cleaning")
+    with DATASETS.locked(name):
+        previous = DATASETS.load(name)
+        deduped, duplicate_index, stats, state, diff = update_dataset(
+            df, previous, options.get("dataset_key"), "excel" in plan["outputs"], timings
+        )
+        DATASETS.save(name, state)
+    if timings is not None:
+        timings.count("rows_out", stats.rows)
+        timings.count("columns_out", len(stats.columns))
+
+    report("metrics")
+    with stage(timings, "metrics"):
+        metrics = stats.metrics()
+        if not plan["frequencies"]:
+            metrics["frequencies"] = {}
+        metrics["duplicate_rows"] = len(duplicate_index)
+        metrics["duplicate_index"] = duplicate_index
+        metrics["dataset"] = dict(diff, name=name)
+        if plan["tables"]:
+            add_summary_tables(metrics)
+
+    # deduped is None exactly when the xlsx is not wanted, and then
+    # finish_report never calls the builder
+    def excel_builder():
+        return build_excel(
+            deduped, *excel_tables(metrics),
+            mode=options.get("excel_mode", EXCEL_WRITE_MODE),
+            timings=timings,
+            heatmap=plan["heatmap"],
+            charts=plan["charts"]
+        )
+
+    result = finish_report(
+        original_filename, original_columns_list, stats.columns,
+        excel_builder, metrics, options, report, timings
+    )
+    result["dataset"] = metrics["dataset"]
+    return result
+
+
+# ---------------- MULTI-SHEET WORKBOOKS ----------------
+# sheets="all" (or "*") processes every sheet of the workbook, and a comma
+# separated list of names processes just those. The workbook is parsed
+# once, then every sheet is cleaned and measured on the sheet pool
+# (SHEET_EXECUTOR, same choices as the artifact pool). The result is one
+# xlsx with a section of report sheets per input sheet and one PDF with a
+# chapter per sheet.
+SHEET_EXECUTOR = os.environ.get("SHEET_EXECUTOR", "thread")
+
+
+def sheet_selection(value):
+    # In pd.read_excel terms: None reads every sheet, a list reads those
+    if value.strip() in ("all", "*"):
+        return None
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def analyze_sheets(frames, executor, timings=None, plan=None):
+    if executor not in ARTIFACT_EXECUTORS:
+        raise ValueError(f"Unknown sheet executor '{executor}'")
+
+    if executor == "serial" or len(frames) == 1:
+        return [analyze_frame(df, timings=timings, plan=plan) for df in frames.values()]
+
+    # Stage times of sheets analyzed side by side add up. Timings cannot
+    # cross a process boundary, so a process pool is timed as one stage.
+    if executor == "process":
+        with stage(timings, "sheets"):
+            pool = artifact_pool(executor)
+            futures = [pool.submit(analyze_frame, df, None, None, plan) for df in frames.values()]
+            return [future.result() for future in futures]
+
+    pool = artifact_pool(executor)
+    futures = [pool.submit(analyze_frame, df, None, timings, plan) for df in frames.values()]
+    return [future.result() for future in futures]
+
+
+def process_file_sheets(stream, original_filename, options, report, timings=None):
+    with stage(timings, "read"):
+        frames = read_upload(
+            stream,
+            original_filename,
+            engine=options.get("reader_engine"),
+            dtype_backend=options.get("dtype_backend"),
+            sheet_name=sheet_selection(options["sheets"])
+        )
+    # Blank sheets (no header row at all) are left out
+    frames = {name: df for name, df in frames.items() if len(df.columns)}
+    if not frames:
+        raise UploadError("The uploaded file contains no data")
+    for df in frames.values():
+        count_frame(timings, "in", df)
+
+    report("cleaning")
+    plan = report_plan(options)
+    results = analyze_sheets(
+        frames,
+        options.get("sheet_executor") or SHEET_EXECUTOR,
+        timings, plan
+    )
+    for _, df, _ in results:
+        count_frame(timings, "out", df)
+
+    report_id = options.get("report_id")
+    excel_filename = new_excel_filename(report_id)
+    sheet_names = list(frames)
+    summary_texts = [
+        build_summary_text(
+            original_filename, original_columns_list, list(df.columns),
+            excel_filename, metrics
+        )
+        for original_columns_list, df, metrics in results
+    ]
+    summary_text = "\n".join(
+        f"\n        Sheet '{name}':{text}" for name, text in zip(sheet_names, summary_texts)
+    )
+
+    def excel_builder():
+        # One sheet keeps the plain sheet names, several get a prefix each
+        prefixes = section_prefixes(sheet_names) if len(sheet_names) > 1 else [""]
+        sections = [
+            (prefix, df, excel_tables(metrics))
+            for prefix, (_, df, metrics) in zip(prefixes, results)
+        ]
+        return build_excel_sections(
+            sections, mode=options.get("excel_mode", EXCEL_WRITE_MODE), timings=timings,
+            heatmap=plan["heatmap"], charts=plan["charts"]
+        )
+
+    # ---------------- EXCEL + PDF GENERATION ----------------
+    report("artifacts")
+    pdf_filename = new_pdf_filename(report_id)
+    pdf_args = None
+    if "pdf" in plan["outputs"]:
+        pdf_sections = [
+            (name, text, metrics["summary_df"], metrics["null_df"], metrics["stats_df"], pdf_frequencies(metrics))
+            for name, text, (_, _, metrics) in zip(sheet_names, summary_texts, results)
+        ]
+        pdf_args = (original_filename, excel_filename, pdf_filename, pdf_sections, report_id)
+    artifacts, errors = build_artifacts(
+        excel_builder if "excel" in plan["outputs"] else None, pdf_args,
+        executor=options.get("artifact_executor") or ARTIFACT_EXECUTOR,
+        pdf_builder=build_sheets_pdf,
+        timings=timings,
+        stable=report_id is not None
+    )
+
+    return report_result(artifacts, errors, summary_text, excel_filename, pdf_filename, report_id)
+
+
+# ---------------- WARM-UP ----------------
+# Runs a few rows through the whole pipeline, once as xlsx and once as CSV,
+# so the readers, pandas' lazy modules, openpyxl, reportlab and the PDF
+# template are all loaded and built before the first real request. The
+# gunicorn config calls it in the master process, ahead of the fork, so
+# every worker starts warm and shares those pages copy-on-write. It runs
+# serially on purpose: pools created before a fork are unusable after it.
+WARM_UP_OPTIONS = {"artifact_executor": "serial", "sheet_executor": "serial"}
+
+
+def warm_up():
+    df = pd.DataFrame({
+        "Name": ["  alice ", "Bob", "bob"],
+        "Email": ["A@X.COM", "b@x.com", None],
+        "Country": ["Greece", "greece ", "Cyprus"],
+        "Nationality": ["Greek", "Greek", None],
+        "Age": [31, 42, None],
+        "Joined": pd.to_datetime(["2024-01-02", "2024-03-04", None]),
+    })
+
+    xlsx = io.BytesIO()
+    df.to_excel(xlsx, index=False)
+    csv = io.BytesIO(df.to_csv(index=False).encode("utf-8"))
+
+    for stream, filename in ((xlsx, "warm-up.xlsx"), (csv, "warm-up.csv")):
+        stream.seek(0)
+        result = process_file(stream, filename, WARM_UP_OPTIONS)
+        if result["errors"]:
+            raise RuntimeError(f"Warm-up failed: {result['errors']}")
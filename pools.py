@@ -0,0 +1,91 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# ---------------- PROCESS POOLS ----------------
+# A ProcessPoolExecutor whose worker dies (an OOM kill, a crash in a native
+# library) is broken for good: its running and queued futures fail with
+# BrokenProcessPool and every later submit raises it. ProcessPool drops a
+# broken executor and builds a new one on the next submit, so a dead worker
+# only costs the tasks it had at the time.
+#
+# Pool workers are started with POOL_START_METHOD, forkserver by default:
+# forking a threaded HTTP worker (gthread) can copy a lock some other
+# thread holds and deadlock the child. The fork server is a clean process
+# that has imported the pipeline once (POOL_PRELOAD), so new workers still
+# start warm.
+#
+# Pool sizes (JOB_WORKERS, BATCH_WORKERS, ARTIFACT_WORKERS), the job queue
+# size and the result cache's CACHE_MEMORY_BYTES are totals for the node.
+# Every HTTP worker process builds its own pools and cache, so each gets
+# node_share() of them: the total split over the WEB_CONCURRENCY worker
+# processes (gunicorn.conf.py sets it), at least 1.
+#
+# Work that runs in a pool process already (a batch file, an async job)
+# must not start a process pool of its own: that nests pools, and a pool
+# worker starting one can hang. in_pool_options() sends its artifacts and
+# sheets to threads instead, unset executors included, since the server
+# default may be "process".
+
+POOL_START_METHOD = os.environ.get("POOL_START_METHOD", "forkserver")
+POOL_PRELOAD = ["pipeline"]
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+NESTED_EXECUTOR_OPTIONS = ("artifact_executor", "sheet_executor")
+
+
+def node_share(total):
+    return max(1, total // WEB_CONCURRENCY)
+
+
+def in_pool_options(options):
+    return dict(options, **{
+        name: "thread" for name in NESTED_EXECUTOR_OPTIONS
+        if options.get(name) in (None, "process")
+    })
+
+
+def pool_context():
+    context = multiprocessing.get_context(POOL_START_METHOD)
+    if POOL_START_METHOD == "forkserver":
+        context.set_forkserver_preload(POOL_PRELOAD)
+    return context
+
+
+class ProcessPool:
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        with self._lock:
+            # Created lazily so importing the app never forks
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+            return self._executor
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def submit(self, fn, *args):
+        executor = self._current()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # Broke since the last submit; one retry on a fresh executor
+            self._discard(executor)
+            executor = self._current()
+            future = executor.submit(fn, *args)
+
+        def check(future):
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self._discard(executor)
+
+        future.add_done_callback(check)
+        return future
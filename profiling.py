@@ -0,0 +1,137 @@
+import os
+import sys
+import uuid
+import cProfile
+import tempfile
+import threading
+from collections import Counter
+
+
+# ---------------- REQUEST PROFILING ----------------
+# Opt-in profiling of single requests, for inputs that are slow in
+# production and cannot be reproduced locally. The server has to allow it
+# with PROFILING_ENABLED=1; a request then asks for it with ?profile=<kind>
+# or an "X-Profile: <kind>" header:
+# - "pstats": deterministic cProfile run, saved in the pstats binary format
+#   (load it with pstats.Stats or snakeviz)
+# - "collapsed": sampling profiler, saved as collapsed stacks, one
+#   "frame;frame;frame count" line per stack (flamegraph.pl, speedscope)
+# The profile is stored under PROFILE_DIR, its id goes out in the
+# X-Profile-Id header and it is downloaded from GET /profiles/<id>.
+# Both profilers only see the request thread, so profiled requests build
+# their artifacts and sheets serially.
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "excel-api-profiles"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 50))
+PROFILE_SAMPLE_SECONDS = float(os.environ.get("PROFILE_SAMPLE_SECONDS", 0.005))
+
+PROFILE_KINDS = {
+    "pstats": ".prof",
+    "collapsed": ".collapsed",
+}
+
+
+def profile_kind(value):
+    # "1" is shorthand for the default profiler
+    if value == "1":
+        return "pstats"
+    return value
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    # Samples one thread's Python stack from a background thread
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_path(profile_id):
+    # Ids are uuid4 hex strings; anything else never touches the filesystem
+    if len(profile_id) != 32 or not all(c in "0123456789abcdef" for c in profile_id):
+        return None
+    for extension in PROFILE_KINDS.values():
+        path = os.path.join(PROFILE_DIR, profile_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def modified_time(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        # Removed by a concurrent prune
+        return 0
+
+
+def prune_profiles():
+    # Keeps the newest PROFILE_MAX_FILES profiles
+    paths = [os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR)]
+    paths.sort(key=modified_time, reverse=True)
+    for path in paths[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class RequestProfile:
+    # The id is known up front, so an error response can point at the
+    # profile too; it is saved even when the profiled call raises
+
+    def __init__(self, kind):
+        if kind not in PROFILE_KINDS:
+            raise ValueError(f"Unknown profile kind '{kind}'")
+        self.kind = kind
+        self.id = uuid.uuid4().hex
+        self.path = os.path.join(PROFILE_DIR, self.id + PROFILE_KINDS[kind])
+
+    def run(self, fn, *args, **kwargs):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if self.kind == "pstats":
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                profiler.dump_stats(self.path)
+                prune_profiles()
+
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sampler.stop()
+            with open(self.path, "w") as f:
+                f.write(sampler.collapsed())
+            prune_profiles()
@@ -0,0 +1,315 @@
+import os
+import importlib.util
+
+import pandas as pd
+
+
+# ---------------- INPUT READERS ----------------
+# Every upload goes through read_upload(), which detects the file format
+# and picks the fastest reader that is installed. calamine and pyarrow are
+# optional: without them we fall back to openpyxl and numpy dtypes.
+
+INPUT_FORMATS = ("xlsx", "xls", "csv", "parquet", "feather")
+# Formats with sheets to pick from (?sheets=)
+SHEET_FORMATS = ("xlsx", "xls")
+
+EXTENSION_FORMATS = {
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".xls": "xls",
+    ".csv": "csv",
+    ".txt": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+}
+
+# Leading bytes of each binary format. Anything else is treated as CSV.
+MAGIC_FORMATS = (
+    (b"PK\x03\x04", "xlsx"),
+    (b"\xd0\xcf\x11\xe0", "xls"),
+    (b"PAR1", "parquet"),
+    (b"ARROW1", "feather"),
+    (b"FEA1", "feather"),
+)
+
+EXCEL_ENGINE = os.environ.get("INPUT_EXCEL_ENGINE", "auto")
+DTYPE_BACKEND = os.environ.get("INPUT_DTYPE_BACKEND", "auto")
+# Values of ?reader_engine= and ?dtype_backend= (checked up front by the app)
+EXCEL_ENGINES = ("auto", "calamine", "openpyxl")
+DTYPE_BACKENDS = ("auto", "numpy", "pyarrow", "numpy_nullable")
+
+
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+HAS_CALAMINE = has_module("python_calamine")
+HAS_PYARROW = has_module("pyarrow")
+
+
+class UploadError(ValueError):
+    pass
+
+
+def unreadable(fmt):
+    # Plain and chunked runs read with different libraries, which word the
+    # same damage differently; both raise this, the cause chained
+    return UploadError(f"The uploaded file could not be read as {fmt}")
+
+
+def missing_sheets(names):
+    quoted = ", ".join(f"'{name}'" for name in names)
+    return f"Sheet{'s' if len(names) > 1 else ''} not found in the workbook: {quoted}"
+
+
+def resolve_excel_engine(engine=None):
+    engine = engine or EXCEL_ENGINE
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unknown reader_engine '{engine}'")
+    if engine == "auto":
+        return "calamine" if HAS_CALAMINE else "openpyxl"
+    if engine == "calamine" and not HAS_CALAMINE:
+        raise ValueError("Excel engine 'calamine' requires the python-calamine package")
+    return engine
+
+
+def resolve_dtype_backend(backend=None):
+    backend = backend or DTYPE_BACKEND
+    if backend not in DTYPE_BACKENDS:
+        raise ValueError(f"Unknown dtype_backend '{backend}'")
+    if backend == "auto":
+        return "pyarrow" if HAS_PYARROW else "numpy"
+    if backend == "pyarrow" and not HAS_PYARROW:
+        raise ValueError("dtype_backend 'pyarrow' requires the pyarrow package")
+    return backend
+
+
+def file_path(stream):
+    # Path of the file behind a stream, when there is one: uploads spooled
+    # to disk and job or batch inputs. Readers given the path open and seek
+    # the file themselves (parquet and CSV memory-map it) instead of
+    # copying it into memory through the Python stream.
+    name = getattr(stream, "name", None)
+    if not isinstance(name, str) or not os.path.isfile(name):
+        return None
+    stream.flush()
+    return name
+
+
+def sniff_format(head):
+    for magic, fmt in MAGIC_FORMATS:
+        if head.startswith(magic):
+            return fmt
+    return None
+
+
+def detect_format(stream, filename=None):
+    # The extension wins when it is known, otherwise look at the first bytes
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in EXTENSION_FORMATS:
+        return EXTENSION_FORMATS[ext]
+
+    position = stream.tell()
+    head = stream.read(8)
+    stream.seek(position)
+
+    return sniff_format(head) or "csv"
+
+
+def read_upload(stream, filename=None, fmt=None, engine=None, dtype_backend=None, sheet_name=0):
+    # sheet_name follows pd.read_excel: a list of names, or None for every
+    # sheet, returns a {name: DataFrame} dict read from a single parse
+    fmt = fmt or detect_format(stream, filename)
+    if fmt not in INPUT_FORMATS:
+        raise UploadError(f"Unsupported input format '{fmt}'")
+    if sheet_name != 0 and fmt not in SHEET_FORMATS:
+        raise ValueError("Selecting sheets is only supported for Excel workbooks")
+
+    backend = resolve_dtype_backend(dtype_backend)
+    if fmt in SHEET_FORMATS:
+        engine = resolve_excel_engine(engine)
+    try:
+        return read_frame(stream, fmt, engine, backend, sheet_name)
+    except (UploadError, MemoryError):
+        raise
+    except Exception as e:
+        raise unreadable(fmt) from e
+
+
+def read_frame(stream, fmt, engine, backend, sheet_name):
+    # "numpy" means the plain pandas defaults
+    kwargs = {} if backend == "numpy" else {"dtype_backend": backend}
+    path = file_path(stream)
+    source = path or stream
+
+    if fmt in ("xlsx", "xls"):
+        if fmt == "xls" and engine == "openpyxl":
+            engine = None   # let pandas pick xlrd for legacy files
+        with pd.ExcelFile(source, engine=engine) as workbook:
+            # Named sheets are checked first, so the error can name them
+            if isinstance(sheet_name, list):
+                missing = [name for name in sheet_name if name not in workbook.sheet_names]
+                if missing:
+                    raise UploadError(missing_sheets(missing))
+            return pd.read_excel(workbook, sheet_name=sheet_name, **kwargs)
+
+    if fmt == "csv":
+        if backend == "pyarrow":
+            try:
+                return pd.read_csv(source, engine="pyarrow", **kwargs)
+            except Exception:
+                # pyarrow rejects some files the C engine reads (a header
+                # with no newline after it, for one). Chunked runs always
+                # read CSV with the C engine, so it gets the last word here
+                # too and both modes accept the same files.
+                if not path:
+                    stream.seek(0)
+        if path:
+            kwargs["memory_map"] = True
+        return pd.read_csv(source, **kwargs)
+
+    if fmt == "parquet":
+        if path and HAS_PYARROW:
+            kwargs["memory_map"] = True
+        return pd.read_parquet(source, **kwargs)
+
+    return pd.read_feather(source, **kwargs)
+
+
+# ---------------- CHUNKED READERS ----------------
+# iter_chunks() yields the upload as DataFrames of at most chunk_rows rows,
+# indexed by their position in the file, so the whole sheet never has to
+# be held in memory. Legacy .xls and Feather v1 files have no streaming
+# reader and are sliced after a full read.
+
+def unique_headers(header):
+    # Mirror pandas' header handling: blank names become "Unnamed: i" and
+    # repeated names get a ".N" suffix
+    seen = {}
+    columns = []
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def frame_chunks(rows, columns, chunk_rows):
+    # A header with no rows under it still yields one empty chunk, as the
+    # CSV reader does, so the columns make it into the report
+    batch = []
+    empty = True
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunk_rows:
+            yield pd.DataFrame(batch, columns=columns)
+            batch = []
+            empty = False
+    if batch or empty:
+        yield pd.DataFrame(batch, columns=columns)
+
+
+def iter_xlsx_chunks(stream, chunk_rows):
+    # openpyxl's read-only mode parses the sheet XML lazily, row by row
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = unique_headers(header)
+        width = len(columns)
+        padded = (tuple(row[:width]) + (None,) * (width - len(row)) for row in rows)
+        yield from frame_chunks(padded, columns, chunk_rows)
+    finally:
+        workbook.close()
+
+
+def iter_arrow_chunks(batches, schema, backend):
+    types_mapper = pd.ArrowDtype if backend == "pyarrow" else None
+    empty = True
+    for batch in batches:
+        empty = False
+        yield batch.to_pandas(types_mapper=types_mapper)
+    if empty:
+        yield schema.empty_table().to_pandas(types_mapper=types_mapper)
+
+
+def is_arrow_file(stream):
+    # Feather v2 is an Arrow IPC file, v1 has its own layout
+    position = stream.tell()
+    magic = stream.read(6)
+    stream.seek(position)
+    return magic == b"ARROW1"
+
+
+def iter_raw_chunks(stream, fmt, chunk_rows, engine, backend):
+    kwargs = {} if backend == "numpy" else {"dtype_backend": backend}
+    path = file_path(stream)
+    source = path or stream
+
+    if fmt == "csv":
+        # The pyarrow CSV engine cannot chunk, so the C engine is used here
+        yield from pd.read_csv(source, chunksize=chunk_rows, memory_map=bool(path), **kwargs)
+        return
+
+    if fmt == "xlsx":
+        for chunk in iter_xlsx_chunks(source, chunk_rows):
+            yield chunk if backend == "numpy" else chunk.convert_dtypes(dtype_backend=backend)
+        return
+
+    if fmt == "parquet" and HAS_PYARROW:
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(source, memory_map=bool(path))
+        batches = parquet.iter_batches(batch_size=chunk_rows)
+        yield from iter_arrow_chunks(batches, parquet.schema_arrow, backend)
+        return
+
+    if fmt == "feather" and HAS_PYARROW and is_arrow_file(stream):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        reader = ipc.open_file(pa.memory_map(path) if path else stream)
+        batches = (
+            batch.slice(start, chunk_rows)
+            for batch in (reader.get_batch(i) for i in range(reader.num_record_batches))
+            for start in range(0, batch.num_rows, chunk_rows)
+        )
+        yield from iter_arrow_chunks(batches, reader.schema, backend)
+        return
+
+    stream.seek(0)
+    df = read_upload(stream, fmt=fmt, engine=engine, dtype_backend=backend)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def iter_chunks(stream, filename=None, chunk_rows=50000, fmt=None, engine=None, dtype_backend=None):
+    fmt = fmt or detect_format(stream, filename)
+    if fmt not in INPUT_FORMATS:
+        raise UploadError(f"Unsupported input format '{fmt}'")
+
+    backend = resolve_dtype_backend(dtype_backend)
+
+    # Read errors surface as UploadError, as they do from read_upload
+    chunks = iter_raw_chunks(stream, fmt, chunk_rows, engine, backend)
+    offset = 0
+    while True:
+        try:
+            chunk = next(chunks, None)
+        except (UploadError, MemoryError):
+            raise
+        except Exception as e:
+            raise unreadable(fmt) from e
+        if chunk is None:
+            break
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+
+# ---------------- COLUMN RULES ----------------
+# How each column is standardized and which columns get a frequency table,
+# kept as data. COLUMN_RULES_FILE points at a JSON list of rules; without it
+# DEFAULT_RULES apply, which match the original hard-coded behaviour. A
+# rule matches an (upper-cased) column name by exact "column" or by a
+# "pattern" regex, and sets any of:
+# - "type": coerce to "numeric", "datetime" or "text" before the text rules
+# - "trim": strip the ends and collapse inner whitespace (default true)
+# - "case": "upper" (default), "lower" or "keep"
+# - "replace": [[regex, replacement], ...], applied in order after trim
+#   and case, so the patterns see the normalized text
+# - "frequency": label of a frequency table, true for the column name
+# - "chart": bar chart of the frequency table in the xlsx (default true)
+# - "pdf": frequency table in the PDF as well (default false)
+# Every matching rule applies in file order and later keys win, so a broad
+# pattern can be refined by an exact rule after it. Rules are loaded and
+# compiled once per process and resolved once per column name.
+
+COLUMN_RULES_FILE = os.environ.get("COLUMN_RULES_FILE")
+
+DEFAULT_RULES = [
+    {"column": "EMAIL", "case": "lower"},
+    {"column": "COUNTRY", "frequency": "Country", "pdf": True},
+    {"column": "NATIONALITY", "frequency": "Nationality"},
+]
+
+RULE_DEFAULTS = {
+    "type": None,
+    "trim": True,
+    "replace": (),
+    "case": "upper",
+    "frequency": None,
+    "chart": True,
+    "pdf": False,
+}
+
+COLUMN_TYPES = ("numeric", "datetime", "text")
+RESOLVED_COLUMNS_MAX = 10000
+CASES = ("upper", "lower", "keep")
+
+
+class RuleError(ValueError):
+    pass
+
+
+def compile_rule(rule):
+    if not isinstance(rule, dict):
+        raise RuleError(f"A rule must be an object, got {rule!r}")
+
+    settings = dict(rule)
+    column = settings.pop("column", None)
+    pattern = settings.pop("pattern", None)
+    if (column is None) == (pattern is None):
+        raise RuleError(f"A rule needs exactly one of 'column' or 'pattern': {rule!r}")
+
+    unknown = sorted(set(settings) - set(RULE_DEFAULTS))
+    if unknown:
+        raise RuleError(f"Unknown rule keys {', '.join(unknown)}: {rule!r}")
+    if settings.get("type") not in (None,) + COLUMN_TYPES:
+        raise RuleError(f"Unknown type '{settings['type']}': {rule!r}")
+    if settings.get("case", "upper") not in CASES:
+        raise RuleError(f"Unknown case '{settings['case']}': {rule!r}")
+
+    try:
+        if "replace" in settings:
+            settings["replace"] = tuple(
+                (re.compile(regex), replacement) for regex, replacement in settings["replace"]
+            )
+        if pattern is not None:
+            matcher = re.compile(pattern).fullmatch
+        else:
+            name = column.strip().upper()
+            matcher = name.__eq__
+    except (re.error, TypeError, ValueError) as e:
+        raise RuleError(f"Invalid rule {rule!r}: {e}")
+
+    return matcher, settings
+
+
+class ColumnRules:
+
+    def __init__(self, rules):
+        self.rules = [compile_rule(rule) for rule in rules]
+        # Part of the result cache key (see cache.py)
+        self.fingerprint = hashlib.sha256(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def rule_for(self, column):
+        # Merged settings for one column; "order" is the position of the
+        # rule that asked for its frequency table
+        with self._lock:
+            resolved = self._resolved.get(column)
+        if resolved is not None:
+            return resolved
+
+        resolved = dict(RULE_DEFAULTS, order=None)
+        for position, (matcher, settings) in enumerate(self.rules):
+            if matcher(column):
+                resolved.update(settings)
+                if "frequency" in settings:
+                    resolved["order"] = position
+        if resolved["frequency"] is True:
+            resolved["frequency"] = column.title()
+
+        with self._lock:
+            # Column names come from uploads, so the memo is kept bounded
+            if len(self._resolved) >= RESOLVED_COLUMNS_MAX:
+                self._resolved.clear()
+            self._resolved[column] = resolved
+        return resolved
+
+    def frequency_columns(self, columns):
+        # column -> label, in rule order and then column order
+        picked = [
+            (self.rule_for(col)["order"], position, col)
+            for position, col in enumerate(columns)
+            if self.rule_for(col)["frequency"]
+        ]
+        return {col: self.rule_for(col)["frequency"] for _, _, col in sorted(picked)}
+
+
+def load_rules(path=COLUMN_RULES_FILE):
+    if not path:
+        return ColumnRules(DEFAULT_RULES)
+    with open(path) as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise RuleError(f"{path} must hold a list of rules")
+    return ColumnRules(rules)
+
+
+COLUMN_RULES = load_rules()
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+
+# ---------------- MERGEABLE SKETCHES ----------------
+# Small fixed-size summaries used by the approximate statistics mode:
+# - KLLSketch: quantiles (median) with a bounded rank error
+# - HyperLogLog: distinct counts with a bounded relative error
+# - FrequentItems: Misra-Gries heavy hitters for top-k frequency tables
+# Each one can be updated a chunk at a time and merged with another
+# sketch of the same size.
+
+KLL_K = 200
+HLL_PRECISION = 12
+TOP_K = 100
+
+
+class KLLSketch:
+    # Level i holds items of weight 2**i. When a level outgrows its
+    # capacity it is sorted and every other item (random offset) moves up.
+
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def rank_error(self):
+        # Normalized single-rank error at ~99% confidence (Karnin et al.,
+        # constants as published for the DataSketches KLL implementation)
+        return 2.296 / self.k ** 0.9723
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                items = np.sort(items)
+                # An odd item out stays on this level
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[:len(items) - len(keep)][self.rng.integers(2)::2]
+
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantile(self, q):
+        if self.n == 0:
+            return np.nan
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level_items), 2 ** level, dtype="int64")
+            for level, level_items in enumerate(self.levels)
+        ])
+        order = np.argsort(items, kind="stable")
+        cumulative = weights[order].cumsum()
+        position = np.searchsorted(cumulative, q * cumulative[-1])
+        return items[order][min(position, len(items) - 1)]
+
+
+def bit_length(x):
+    # Bit length of every uint64 in x, exact below 2**53 (float64 holds
+    # those exactly and frexp returns the exponent)
+    return np.frexp(x.astype("float64"))[1]
+
+
+def distinct_values(series):
+    # Non-null values to hash. A repeated value cannot raise a register, so
+    # a categorical only gives its used categories and text its distinct
+    # values; numbers hash faster than pd.unique finds their distinct ones.
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        used = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories)) > 0
+        return pd.Series(series.cat.categories[used])
+    series = series.dropna()
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.Series(series.unique())
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype="uint8")
+
+    def relative_error(self):
+        return 1.04 / np.sqrt(self.m)
+
+    def update(self, series):
+        series = distinct_values(series)
+        if series.empty:
+            return
+
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy()
+        tail_bits = 64 - self.precision
+        index = (hashes >> np.uint64(tail_bits)).astype("intp")
+        tail = hashes & np.uint64((1 << tail_bits) - 1)
+        rank = (tail_bits - bit_length(tail) + 1).astype("uint8")
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype("float64"))
+
+        # Linear counting for small cardinalities
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class FrequentItems:
+    # Misra-Gries summary with at most k counters. Reported counts are
+    # lower bounds, low by at most `error` (itself at most n / (k + 1)).
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.n = 0
+        self.error = 0
+        self.counts = pd.Series(dtype="int64")
+
+    def update(self, series):
+        self.update_counts(series.value_counts(sort=False))
+
+    def update_counts(self, counts):
+        self.n += int(counts.sum())
+        merged = self.counts.add(counts, fill_value=0).astype("int64")
+
+        if len(merged) > self.k:
+            cut = merged.nlargest(self.k + 1).iloc[-1]
+            merged = merged[merged > cut] - cut
+            self.error += int(cut)
+
+        self.counts = merged
+
+    def merge(self, other):
+        n = self.n + other.n
+        self.update_counts(other.counts)
+        self.n = n
+        self.error += other.error
+
+    def top(self):
+        return self.counts.sort_values(ascending=False, kind="stable")
@@ -0,0 +1,322 @@
+import numpy as np
+import pandas as pd
+
+from sketches import KLLSketch, HyperLogLog, FrequentItems
+
+
+# ---------------- STREAMING STATISTICS ----------------
+# StreamingStats is fed the cleaned frame one chunk at a time and produces
+# the same tables as the in-memory METRICS stage. Null counts, min/max and
+# frequency tables add up directly; mean and variance are merged per chunk
+# with Chan's parallel form of Welford's algorithm. The median stays exact
+# by keeping a count per distinct value, so its memory follows the number
+# of distinct numeric values rather than the number of rows.
+#
+# With approx=True the median comes from a KLL sketch, frequency tables
+# from a Misra-Gries top-k summary, and every column also gets a
+# HyperLogLog distinct count, so memory stays fixed per column. Only the
+# chunked mode uses it (approx=1 on a request, which needs chunked=1 and
+# is otherwise refused with a 400): a frame that is in memory already gets
+# exact statistics, which cost less than the sketches there.
+#
+# details=False keeps only the row and null counts behind the summary text
+# and quality score: no numeric accumulators and no distinct counts, and
+# stats_df comes out empty.
+#
+# The exact statistics can also forget rows: remove() takes out rows an
+# earlier update() counted, which is how a new version of a dataset is
+# folded in (see datasets.py). Counts subtract directly; mean, variance,
+# min and max are rebuilt from the per-value counts. Sketches cannot
+# forget, so approx=True does not support it. removable_rows() cuts rows
+# down to what remove() reads of them, to be kept until they are removed.
+
+STAT_COLUMNS = ["Mean", "Median", "Std Dev", "Min", "Max"]
+
+
+def quality_score_for(total_nulls, total_cells):
+    return round((1 - total_nulls/total_cells) * 100, 2)
+
+
+def present_counts(values):
+    # value -> count in order of first appearance, like value_counts(sort=False)
+    # on a plain column. A categorical is counted on its integer codes, and
+    # categories left without rows (e.g. after dedup) are not listed.
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values.value_counts(sort=False)
+
+    codes = values.cat.codes.to_numpy()
+    codes = codes[codes >= 0]
+    first = pd.unique(codes)
+    counts = np.bincount(codes, minlength=len(values.cat.categories))[first]
+    return pd.Series(counts, index=values.cat.categories[first], name="count")
+
+
+def sorted_counts(values):
+    # Largest counts first, ties in order of first appearance
+    return present_counts(values).sort_values(ascending=False, kind="stable")
+
+
+def frequency_table(counts, label):
+    # counts is a Series of value -> count, largest counts first
+    table = counts.reset_index()
+    table.columns = [label, "Count"]
+    return table
+
+
+def add_counts(counts, delta):
+    # counts and delta are Series of value -> count, counts sorted by value
+    # and delta without repeats. Merged with binary searches instead of an
+    # index alignment, so adding a few values to many costs a copy of the
+    # arrays, not a hash table over them. Values whose count drops to 0
+    # are left out.
+    delta = delta.sort_index()
+    values, weights = counts.index.to_numpy(dtype="float64"), counts.to_numpy(dtype="int64")
+    new_values, new_weights = delta.index.to_numpy(dtype="float64"), delta.to_numpy(dtype="int64")
+
+    positions = np.searchsorted(values, new_values)
+    found = values[np.minimum(positions, len(values) - 1)] == new_values if len(values) else positions < 0
+    weights = weights.copy()
+    weights[positions[found]] += new_weights[found]
+    values = np.insert(values, positions[~found], new_values[~found])
+    weights = np.insert(weights, positions[~found], new_weights[~found])
+
+    present = weights > 0
+    return pd.Series(weights[present], index=values[present], dtype="int64")
+
+
+def median_from_counts(counts):
+    # counts is a Series of value -> count, sorted by value
+    total = int(counts.sum())
+    if total == 0:
+        return np.nan
+
+    cumulative = counts.to_numpy().cumsum()
+    values = counts.index.to_numpy()
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2 + 1)]
+    upper = values[np.searchsorted(cumulative, total // 2 + 1)]
+    return (lower + upper) / 2
+
+
+class NumericAccumulator:
+
+    def __init__(self, approx=False):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.counts = pd.Series(dtype="int64")   # sorted by value
+        self.sketch = KLLSketch() if approx else None
+
+    def update(self, values):
+        values = values.dropna()
+        if values.empty:
+            return
+
+        x = values.to_numpy(dtype="float64")
+        n_b = len(x)
+        mean_b = x.mean()
+        m2_b = ((x - mean_b) ** 2).sum()
+
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta ** 2 * self.n * n_b / n
+        self.n = n
+
+        chunk_min, chunk_max = values.min(), values.max()
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+        if self.sketch is not None:
+            self.sketch.update(x)
+        else:
+            self.counts = add_counts(self.counts, pd.Series(x).value_counts())
+
+    def remove(self, values):
+        values = values.dropna()
+        if values.empty:
+            return
+
+        removed = pd.Series(values.to_numpy(dtype="float64")).value_counts()
+        self.counts = add_counts(self.counts, -removed)
+
+        if self.counts.empty:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            self.min = self.max = None
+            return
+
+        x = self.counts.index.to_numpy(dtype="float64")
+        weights = self.counts.to_numpy()
+        self.n = int(weights.sum())
+        self.mean = float((x * weights).sum() / self.n)
+        self.m2 = float((weights * (x - self.mean) ** 2).sum())
+        self.min, self.max = x.min(), x.max()
+
+    def row(self):
+        if self.n == 0:
+            return [np.nan] * len(STAT_COLUMNS)
+
+        std = np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.nan
+        if self.sketch is not None:
+            median = self.sketch.quantile(0.5)
+        else:
+            median = median_from_counts(self.counts)
+        return [self.mean, median, std, self.min, self.max]
+
+
+class StreamingStats:
+
+    def __init__(self, frequency_columns=None, approx=False, details=True):
+        self.approx = approx
+        self.details = details
+        self.rows = 0
+        self.columns = None
+        self.null_counts = None
+        self.numeric = {}
+        self.non_numeric = set()
+        self.distinct = {}
+        self.frequency_columns = frequency_columns or {}
+        self.frequencies = {
+            col: FrequentItems() if approx else {}
+            for col in self.frequency_columns
+        }
+
+    def update(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.null_counts = pd.Series(0, index=self.columns, dtype="int64")
+            if self.approx and self.details:
+                self.distinct = {col: HyperLogLog() for col in self.columns}
+
+        self.rows += len(chunk)
+        self.null_counts += chunk.isnull().sum()
+        if self.details:
+            self.update_numeric(chunk)
+
+        for col, counts in self.frequencies.items():
+            if col not in chunk.columns:
+                continue
+            if self.approx:
+                counts.update_counts(present_counts(chunk[col]))
+            else:
+                for value, count in present_counts(chunk[col]).items():
+                    counts[value] = counts.get(value, 0) + int(count)
+
+        for col, sketch in self.distinct.items():
+            sketch.update(chunk[col])
+
+    def remove(self, chunk):
+        # chunk holds rows that an earlier update() counted
+        if self.approx:
+            raise ValueError("Approximate statistics cannot remove rows")
+
+        self.rows -= len(chunk)
+        self.null_counts -= chunk.isnull().sum()
+        if self.details:
+            for col, accumulator in self.numeric.items():
+                accumulator.remove(chunk[col])
+
+        for col, counts in self.frequencies.items():
+            if col not in chunk.columns:
+                continue
+            for value, count in present_counts(chunk[col]).items():
+                left = counts[value] - int(count)
+                if left:
+                    counts[value] = left
+                else:
+                    del counts[value]
+
+    def removable_rows(self, chunk):
+        # The rows as remove() sees them: numeric and frequency values as
+        # categoricals (codes into the distinct values), every other column
+        # reduced to whether the cell is empty
+        columns = {}
+        for col in chunk.columns:
+            if col in self.numeric:
+                values = chunk[col].to_numpy(dtype="float64", na_value=np.nan)
+            elif col in self.frequencies:
+                values = chunk[col].to_numpy(dtype=object)
+            else:
+                values = np.where(chunk[col].notna().to_numpy(), "", None)
+            # Categories keep the array's dtype, so versions can be merged
+            codes, uniques = pd.factorize(values)
+            columns[col] = pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=values.dtype))
+        return pd.DataFrame(columns, columns=chunk.columns)
+
+    def order_frequencies(self, col, values):
+        # Counts that tie are listed in the order their values were first
+        # counted; reorder them by first appearance in values instead
+        rank = {value: i for i, value in enumerate(pd.unique(values.dropna()))}
+        counts = self.frequencies[col]
+        self.frequencies[col] = dict(sorted(counts.items(), key=lambda item: rank.get(item[0], len(rank))))
+
+    def update_numeric(self, chunk):
+        # A column is numeric while every chunk that has values for it
+        # reads it with a numeric dtype, as select_dtypes would on the frame
+        numeric_columns = set(chunk.select_dtypes(include='number').columns)
+        for col in self.columns:
+            if col in self.non_numeric:
+                continue
+            if col in numeric_columns:
+                self.numeric.setdefault(col, NumericAccumulator(self.approx)).update(chunk[col])
+            elif chunk[col].notna().any():
+                self.non_numeric.add(col)
+                self.numeric.pop(col, None)
+
+    def stats_df(self):
+        columns = [col for col in self.columns if col in self.numeric]
+        if not columns:
+            return pd.DataFrame()
+
+        rows = [self.numeric[col].row() for col in columns]
+        return pd.DataFrame(rows, index=columns, columns=STAT_COLUMNS).astype("float64").round(2)
+
+    def frequency(self, col):
+        if col not in self.frequencies:
+            return pd.DataFrame()
+
+        if self.approx:
+            counts = self.frequencies[col].top()
+        else:
+            counts = pd.Series(self.frequencies[col], name="count", dtype="int64")
+            counts = counts.sort_values(ascending=False, kind="stable")
+
+        if counts.empty:
+            return pd.DataFrame()
+        return frequency_table(counts, self.frequency_columns[col])
+
+    def distinct_counts(self):
+        return pd.Series({col: sketch.count() for col, sketch in self.distinct.items()})
+
+    def error_bounds(self):
+        # Stated error of every approximate figure, for SUMMARY and the PDF
+        frequency_error = max(
+            (items.error for items in self.frequencies.values()), default=0
+        )
+        return {
+            "Median Rank Error (±%)": round(KLLSketch().rank_error() * 100, 2),
+            "Distinct Count Std Error (±%)": round(HyperLogLog().relative_error() * 100, 2),
+            "Frequency Count Error (max)": frequency_error,
+        }
+
+    def metrics(self):
+        num_columns = len(self.columns)
+        total_nulls = self.null_counts.sum()
+        metrics = {
+            "num_rows": self.rows,
+            "num_columns": num_columns,
+            "null_counts": self.null_counts,
+            "total_nulls": total_nulls,
+            "quality_score": quality_score_for(total_nulls, self.rows * num_columns),
+            "stats_df": self.stats_df(),
+        }
+
+        metrics["frequencies"] = {col: self.frequency(col) for col in self.frequency_columns}
+
+        if self.approx:
+            if self.details:
+                metrics["distinct_counts"] = self.distinct_counts()
+            metrics["error_bounds"] = self.error_bounds()
+
+        return metrics
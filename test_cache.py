@@ -0,0 +1,28 @@
+import io
+
+import pytest
+
+import cache
+from app import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def deterministic_etag(client):
+    data = {"outputs": "summary", "deterministic": "1", "file": (io.BytesIO(b"a,b\n1,2\n"), "t.csv")}
+    response = client.post("/process-excel", data=data, headers={"Cache-Control": "no-cache"})
+    assert response.status_code == 200
+    return response.get_etag()[0]
+
+
+def test_etag_follows_server_config(client, monkeypatch):
+    etag = deterministic_etag(client)
+    assert deterministic_etag(client) == etag
+
+    for name, value in (("pdf_top_n", 5), ("rules", "other rules"), ("version", "next release")):
+        with monkeypatch.context() as m:
+            m.setitem(cache.SERVER_CONFIG, name, value)
+            assert deterministic_etag(client) != etag
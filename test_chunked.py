@@ -0,0 +1,44 @@
+import io
+import re
+
+import pandas as pd
+import pytest
+
+from benchmarks.generate import generate_frame
+from pipeline import process_file
+from readers import UploadError
+
+
+def run(data, filename, **options):
+    result = process_file(io.BytesIO(data), filename, dict({"outputs": "excel"}, **options))
+    assert not result["errors"]
+    sheets = pd.read_excel(result["excel"], sheet_name=None)
+    return re.sub(r"processed_\d+_\d+", "", result["summary_text"]), sheets
+
+
+def test_chunked_run_matches_plain_run():
+    df = generate_frame(rows=3000, duplicate_rate=0.1, null_rate=0.05, seed=3)
+    data = df.to_csv(index=False).encode()
+
+    plain_text, plain_sheets = run(data, "t.csv")
+    chunked_text, chunked_sheets = run(data, "t.csv", chunked=True, chunk_rows=250)
+
+    assert chunked_text == plain_text
+    assert list(chunked_sheets) == list(plain_sheets)
+    for name, sheet in plain_sheets.items():
+        pd.testing.assert_frame_equal(chunked_sheets[name], sheet, check_exact=False, obj=name)
+
+
+@pytest.mark.parametrize("filename, data", [
+    ("t.xlsx", b"not a workbook"),
+    ("t.parquet", b"PAR1 not parquet"),
+    ("t.csv", b"\xff\xfe\x00bad,\x00"),
+    ("t.csv", b""),
+])
+def test_unreadable_upload_fails_alike_in_both_modes(filename, data):
+    errors = []
+    for options in ({}, {"chunked": True, "chunk_rows": 2}):
+        with pytest.raises(UploadError) as raised:
+            process_file(io.BytesIO(data), filename, dict(options, outputs="summary"))
+        errors.append(str(raised.value))
+    assert errors[0] == errors[1]
@@ -0,0 +1,92 @@
+import io
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pipeline
+from benchmarks.generate import generate_frame
+from datasets import DatasetStore
+from stats import StreamingStats
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = DatasetStore(str(tmp_path))
+    monkeypatch.setattr(pipeline, "DATASETS", store)
+    return store
+
+
+@pytest.fixture
+def work(monkeypatch):
+    # Rows cleaned, and rows fed to or taken out of the statistics
+    counted = {"cleaned": 0, "stats": 0}
+    clean_frame, update, remove = pipeline.clean_frame, StreamingStats.update, StreamingStats.remove
+
+    def counting_clean(df, timings=None):
+        counted["cleaned"] += len(df)
+        return clean_frame(df, timings)
+
+    def counting_update(self, chunk):
+        counted["stats"] += len(chunk)
+        return update(self, chunk)
+
+    def counting_remove(self, chunk):
+        counted["stats"] += len(chunk)
+        return remove(self, chunk)
+
+    monkeypatch.setattr(pipeline, "clean_frame", counting_clean)
+    monkeypatch.setattr(StreamingStats, "update", counting_update)
+    monkeypatch.setattr(StreamingStats, "remove", counting_remove)
+    return counted
+
+
+def upload(df, **options):
+    data = df.to_csv(index=False).encode()
+    return pipeline.process_file(io.BytesIO(data), "d.csv", dict({"outputs": "summary"}, **options))
+
+
+def changed(df, rows, seed):
+    df = df.copy()
+    picked = np.random.default_rng(seed).choice(len(df), rows, replace=False)
+    df.loc[picked, "Value 0"] = df.loc[picked, "Value 0"] + 1000
+    return df
+
+
+def test_refresh_work_follows_changed_rows(store, work):
+    df = generate_frame(rows=3000, duplicate_rate=0, null_rate=0, seed=7)
+    upload(df, dataset="d")
+    assert work["cleaned"] == 3000
+
+    for rows, seed in ((5, 1), (50, 2)):
+        df = changed(df, rows, seed)
+        work.update(cleaned=0, stats=0)
+        result = upload(df, dataset="d")
+        assert result["dataset"]["rows_processed"] == rows
+        assert work["cleaned"] == rows
+        # Each changed row leaves and joins the deduplicated set once
+        assert work["stats"] == 2 * rows
+
+    # No row data is kept: text outside the frequency columns is gone
+    with open(store._path("d", ".pkl"), "rb") as f:
+        state = f.read().lower()
+    assert b"example.com" not in state and b"person" not in state
+
+def test_refresh_matches_full_run(store):
+    base = generate_frame(rows=2000, duplicate_rate=0.1, null_rate=0.05, seed=4)
+    v2 = pd.concat([changed(base, 30, 3).iloc[40:], base.iloc[:10]], ignore_index=True)
+    v3 = v2.iloc[::-1].reset_index(drop=True)
+
+    def report(df, **options):
+        result = upload(df, outputs="excel", **options)
+        text = re.sub(r"processed_\d+_\d+|Dataset .*\n", "", result["summary_text"])
+        return text, pd.read_excel(result["excel"], sheet_name=None)
+
+    for df in (base, v2, v3):
+        text, sheets = report(df, dataset="d")
+        full_text, full_sheets = report(df)
+        assert text == full_text
+        assert list(sheets) == list(full_sheets)
+        for name, sheet in full_sheets.items():
+            pd.testing.assert_frame_equal(sheets[name], sheet, obj=name)
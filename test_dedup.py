@@ -0,0 +1,68 @@
+import io
+import re
+import math
+
+import numpy as np
+import pandas as pd
+
+import dedup
+from dedup import DuplicateTracker, row_fingerprints
+from pipeline import process_file
+
+
+def test_integer_and_float_rows_hash_alike():
+    ints = pd.DataFrame({"NAME": ["a", "b"], "AGE": [1, 2]})
+    floats = pd.DataFrame({"NAME": ["a", "b"], "AGE": [1.0, 2.0]})
+    assert (row_fingerprints(ints) == row_fingerprints(floats)).all()
+
+
+def test_tracker_matches_rows_across_chunk_dtypes():
+    # The second chunk has a blank AGE, so its AGE column is read as floats
+    tracker = DuplicateTracker()
+    tracker.filter(pd.DataFrame({"NAME": ["a", "b"], "AGE": [1, 2]}))
+    kept = tracker.filter(pd.DataFrame({"NAME": ["a", "c"], "AGE": [1.0, np.nan]}, index=[2, 3]))
+    assert tracker.duplicates == 1
+    assert list(kept["NAME"]) == ["c"]
+
+
+def test_chunked_run_removes_the_same_duplicates():
+    csv = b"Name,Age,Country\na,1,GR\nb,2,GR\nc,3,GR\na,1,GR\nd,,GR\n"
+    options = {"outputs": "summary"}
+
+    def summary(**extra):
+        result = process_file(io.BytesIO(csv), "t.csv", dict(options, **extra))
+        return re.sub(r"processed_\d+_\d+", "", result["summary_text"])
+
+    text = summary(chunked=True, chunk_rows=3)
+    assert "Duplicate Rows Removed: 1." in text
+    assert text == summary()
+
+
+def test_tracker_matches_duplicated_over_the_whole_frame():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"A": rng.integers(0, 3000, 20000), "B": rng.integers(0, 2, 20000)})
+    tracker = DuplicateTracker()
+    kept = pd.concat([tracker.filter(df.iloc[i:i + 700]) for i in range(0, len(df), 700)])
+    expected = df[~df.duplicated()]
+    assert kept.index.equals(expected.index)
+    assert tracker.duplicates == len(df) - len(expected)
+
+
+def test_tracker_cost_grows_n_log_n_over_chunks(monkeypatch):
+    # Every fingerprint is copied by a merge O(log n) times, not once per chunk
+    copied = []
+
+    def counting_merge(older, newer):
+        copied.append(len(older) + len(newer))
+        return np.sort(np.concatenate([older, newer]))
+
+    monkeypatch.setattr(dedup, "merge_runs", counting_merge)
+    chunks, chunk_rows = 512, 100
+    values = np.arange(chunks * chunk_rows)
+    tracker = DuplicateTracker()
+    for i in range(chunks):
+        tracker.filter(pd.DataFrame({"A": values[i * chunk_rows:(i + 1) * chunk_rows]}))
+
+    total = chunks * chunk_rows
+    assert sum(copied) <= total * (math.log2(chunks) + 1)
+    assert len(tracker.runs) <= math.log2(chunks) + 1
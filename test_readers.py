@@ -0,0 +1,24 @@
+import io
+
+import pandas as pd
+import pytest
+
+from readers import read_upload, UploadError
+
+
+def workbook():
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        pd.DataFrame({"A": [1, 2]}).to_excel(writer, sheet_name="One", index=False)
+        pd.DataFrame({"B": [3, 4]}).to_excel(writer, sheet_name="Two", index=False)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize("engine", ["openpyxl", "calamine"])
+def test_missing_sheets_are_named(engine):
+    with pytest.raises(UploadError, match="Sheets not found in the workbook: 'Nope', 'Zip'"):
+        read_upload(workbook(), "t.xlsx", engine=engine, sheet_name=["One", "Nope", "Zip"])
+
+    frames = read_upload(workbook(), "t.xlsx", engine=engine, sheet_name=["Two"])
+    assert list(frames) == ["Two"] and list(frames["Two"].columns) == ["B"]
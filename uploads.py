@@ -0,0 +1,34 @@
+import io
+import os
+import tempfile
+
+from flask import Request
+
+
+# ---------------- UPLOAD LIMITS + SPOOLING ----------------
+# Requests larger than MAX_UPLOAD_BYTES are refused with a 413 from their
+# Content-Length header, before any of the body is read (0 turns the limit
+# off). /process-batch uses MAX_BATCH_UPLOAD_BYTES instead, or the general
+# limit when that is 0.
+#
+# Uploads up to UPLOAD_SPOOL_BYTES are kept in memory. Larger ones are
+# written straight to a named temporary file in UPLOAD_DIR while the form
+# is parsed, so a big upload never sits in worker memory, and the readers
+# open that file by path (see readers.file_path) to seek or memory-map it
+# instead of copying it through the stream. The file is removed when the
+# request ends.
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+MAX_BATCH_UPLOAD_BYTES = int(os.environ.get("MAX_BATCH_UPLOAD_BYTES", 1024 * 1024 * 1024))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", 1024 * 1024))
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR") or None
+
+
+class SpooledUploadRequest(Request):
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        # Without a Content-Length the size is unknown, so go to disk
+        if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_BYTES:
+            return io.BytesIO()
+        return tempfile.NamedTemporaryFile("w+b", dir=UPLOAD_DIR, prefix="excel-api-upload-")